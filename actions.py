@@ -0,0 +1,10 @@
+# Player actions as small ints. The legal actions of a decision are a bitmask with bit
+# 1 << action set for each, computed by PokerGame.legal_actions.
+FOLD, CHECK, CALL, RAISE_50, RAISE_100, ALL_IN = range(6)
+ACTION_NAMES = ['fold', 'check', 'call', 'raise_50', 'raise_100', 'all_in']
+ACTION_CODES = {name: action for action, name in enumerate(ACTION_NAMES)}
+RAISE_PERCENTAGES = {RAISE_50: 50, RAISE_100: 100}
+
+# the actions in each mask, in code order
+MASK_ACTIONS = [[action for action in range(len(ACTION_NAMES)) if mask >> action & 1]
+                for mask in range(1 << len(ACTION_NAMES))]
@@ -0,0 +1,80 @@
+import numpy as np
+from actions import FOLD, CHECK, RAISE_100, ACTION_NAMES, MASK_ACTIONS
+from state_encoding import STAGES, encode_state
+
+# MASK_ACTIONS as arrays: the legal actions of each mask in code order, padded, and how many there are
+MASK_TABLE = np.array([actions + [FOLD] * (len(ACTION_NAMES) - len(actions)) for actions in MASK_ACTIONS])
+MASK_COUNTS = np.array([len(actions) for actions in MASK_ACTIONS])
+ACTION_BITS = 1 << np.arange(len(ACTION_NAMES))
+
+def random_legal_actions(legal, rng):
+    """One uniformly drawn legal action per legal mask."""
+    return MASK_TABLE[legal, (rng.random(len(legal)) * MASK_COUNTS[legal]).astype(np.intp)]
+
+class BatchRandomBot:
+    """RandomBot for BatchPokerGame."""
+    def __init__(self, name):
+        self.name = name
+
+    def act(self, observations):
+        return random_legal_actions(observations.legal, observations.engine.rng)
+
+class BatchHonestBot:
+    """HonestBot's rules for BatchPokerGame."""
+    def __init__(self, name):
+        self.name = name
+
+    def act(self, observations):
+        engine = observations.engine
+        legal = observations.legal
+        hand_strength = engine.hand_strengths(observations)
+
+        # the action picked by hand strength, leaving out the last legal action (all-in) whenever
+        # raise_100 is legal: HonestBot's raise count is always 0, so its facing-a-raise rules never fire
+        count = MASK_COUNTS[legal] - (legal & 1 << RAISE_100 > 0)
+        actions = MASK_TABLE[legal, np.round(hand_strength / 20 * (count - 1)).astype(np.intp)]
+        if engine.stage == 0:
+            actions = np.where(hand_strength < 10, FOLD, actions)
+        return np.where((legal & 1 << CHECK > 0) & (hand_strength < 10), CHECK, actions)
+
+class BatchQLearningBot:
+    """QLearningBot for BatchPokerGame, learning into an ArrayQTable."""
+    def __init__(self, name, q_table, initial_learning_rate=0.1, final_learning_rate=0.5,
+                 initial_exploration_rate=0.5, final_exploration_rate=0.1):
+        self.name = name
+        self.q_table = q_table
+        self.initial_alpha = initial_learning_rate
+        self.final_alpha = final_learning_rate
+        self.initial_epsilon = initial_exploration_rate
+        self.final_epsilon = final_exploration_rate
+        self.alpha = initial_learning_rate
+        self.epsilon = initial_exploration_rate
+        self.states_actions = {} # table -> (state, action) pairs of the hand being played there
+
+    def act(self, observations):
+        engine = observations.engine
+        tables = observations.tables
+        stage = STAGES[engine.stage]
+        position = (observations.seat - engine.dealer_position) % engine.num_seats
+        states = [encode_state(stage, position, hand_strength, history) for history, hand_strength
+                  in zip(engine.history[tables], engine.hand_strengths(observations).tolist())]
+        values = self.q_table.states_values(states)
+        values[observations.legal[:, None] & ACTION_BITS == 0] = -np.inf
+        actions = values.argmax(1)
+        explore = engine.rng.random(len(tables)) < self.epsilon
+        actions[explore] = random_legal_actions(observations.legal[explore], engine.rng)
+        for table, state, action in zip(tables.tolist(), states, actions.tolist()):
+            self.states_actions.setdefault(table, []).append((state, action))
+        return actions
+
+    def receive_rewards(self, tables, rewards):
+        for table, reward in zip(tables.tolist(), rewards.tolist()):
+            states_actions = self.states_actions.pop(table, None)
+            if states_actions:
+                self.q_table.add_reward(states_actions, self.alpha * reward)
+
+    def adjust_learning_rate(self, round_number, total_rounds):
+        self.alpha = self.initial_alpha + (self.final_alpha - self.initial_alpha) * (round_number / total_rounds)
+
+    def adjust_exploration_rate(self, round_number, total_rounds):
+        self.epsilon = self.initial_epsilon - (self.initial_epsilon - self.final_epsilon) * (round_number / total_rounds)
@@ -0,0 +1,418 @@
+import argparse
+import time
+import numpy as np
+from actions import FOLD, CHECK, CALL, RAISE_50, RAISE_100, ALL_IN, RAISE_PERCENTAGES
+from batch_bots import BatchHonestBot, BatchQLearningBot, BatchRandomBot
+from game_log import OFF
+from hand_history import Hand, replay_game
+from hand_rank_monte_carlo import batch_equity, evaluate_hands
+from preflop_equity import MAX_OPPONENTS
+from q_table import ArrayQTable
+from state_encoding import EMPTY_HISTORY, STAGES
+from utils import CARDS, preflop_strengths
+
+PREFLOP_STRENGTHS = np.array(preflop_strengths)
+BOARD_SIZES = (0, 3, 4, 5)
+
+def hand_classes(hands):
+    """preflop_equity.hand_class of every row of an (N, 2) card array."""
+    ranks = hands >> 2
+    high, low = ranks.max(1), ranks.min(1)
+    return np.where((hands[:, 0] ^ hands[:, 1]) & 3 == 0, high * 13 + low, low * 13 + high)
+
+class Observations:
+    """The decision a batched bot's act() makes at every table where its seat is to act,
+    one entry per table in each array. Everything else about those tables (cards, bets,
+    history) is read from the engine's arrays at observations.tables."""
+    __slots__ = ('engine', 'tables', 'seat', 'legal', 'effective_stack', 'call_amount')
+
+    def __init__(self, engine, tables, seat, legal, effective_stack, call_amount):
+        self.engine = engine
+        self.tables = tables
+        self.seat = seat
+        self.legal = legal # legal action masks, see actions.py
+        self.effective_stack = effective_stack
+        self.call_amount = call_amount
+
+class BatchPokerGame:
+    """Plays a hand at each of num_tables independent tables per play_round, all of them in
+    lockstep: stacks, bets, fold masks, cards and pots are (tables, seats) NumPy arrays, and
+    every bot decides for all the tables where its seat is to act in one act(observations)
+    call, see batch_bots.py. The rules are PokerGame's, quirks included, and with record=True
+    every hand is kept so cross_check can replay it through PokerGame."""
+    def __init__(self, bots, num_tables, chips=1000, big_blind=10, small_blind=5, seed=None, record=False):
+        num_seats = len(bots)
+        self.bots = bots
+        self.num_tables = num_tables
+        self.num_seats = num_seats
+        self.big_blind = big_blind
+        self.small_blind = small_blind
+        self.rng = np.random.default_rng(seed) # deals the cards, and bots draw from it too
+        self.initial_chips = np.broadcast_to(np.asarray(chips, dtype=np.int64), (num_seats,)).copy()
+        self.chips = np.tile(self.initial_chips, (num_tables, 1))
+        self.score = np.zeros((num_tables, num_seats), dtype=np.int64)
+        self.starting_chips = np.zeros((num_tables, num_seats), dtype=np.int64)
+        self.bets = np.zeros((num_tables, num_seats), dtype=np.int64) # each seat's current_bet
+        self.folded = np.zeros((num_tables, num_seats), dtype=bool)
+        self.active = np.zeros((num_tables, num_seats), dtype=bool) # could act when the betting round started
+        self.live = np.zeros((num_tables, num_seats), dtype=bool) # can still act in this betting round
+        self.playpot = np.zeros((num_tables, num_seats), dtype=np.intp)
+        self.pots = np.zeros((num_tables, 6), dtype=np.int64)
+        self.pot = np.zeros(num_tables, dtype=np.int64)
+        self.pot_index = np.zeros(num_tables, dtype=np.intp)
+        self.current_bet = np.zeros(num_tables, dtype=np.int64)
+        self.hands = np.zeros((num_tables, num_seats, 2), dtype=np.intp)
+        self.board = np.zeros((num_tables, 5), dtype=np.intp)
+        self.board_size = np.zeros(num_tables, dtype=np.intp)
+        # betting round state: seat to act, last seat to act, whether someone went all-in,
+        # whether the big blind acted, and the packed action history (Python ints)
+        self.current = np.zeros(num_tables, dtype=np.intp)
+        self.last_to_act = np.zeros(num_tables, dtype=np.intp)
+        self.all_in_action = np.zeros(num_tables, dtype=bool)
+        self.bb_acted = np.zeros(num_tables, dtype=bool)
+        self.history = np.full(num_tables, EMPTY_HISTORY, dtype=object)
+        self.strengths = np.full((num_tables, num_seats), -1) # hand strengths of this street, -1 until needed
+        self.dealer_position = 0
+        self.stage = 0 # index into STAGES
+        self.rounds_played = 0
+        self.equity_samples = 100
+        self.score_log = {bot.name: [0] for bot in bots}
+        self.record = record
+        self.recorded_hands = [] # hand_history.Hand of every table and round, while recording
+        self.hand_actions = [[] for _ in range(num_tables)]
+
+    def play_game(self, num_rounds, total_rounds=None):
+        total_rounds = total_rounds or self.rounds_played + num_rounds
+        for _ in range(num_rounds):
+            self.play_round()
+            if self.rounds_played % 100 == 0:
+                for bot, score in zip(self.bots, self.score.sum(0).tolist()):
+                    if isinstance(bot, BatchQLearningBot):
+                        bot.adjust_learning_rate(self.rounds_played, total_rounds)
+                        bot.adjust_exploration_rate(self.rounds_played, total_rounds)
+                    self.score_log[bot.name].append(score)
+
+    def play_round(self):
+        self.starting_chips[:] = self.chips
+        self.reset_for_new_round()
+        self.deal_hands()
+        self.post_blinds()
+        for stage in range(len(STAGES)):
+            self.stage = stage
+            playing = np.flatnonzero((~self.folded).sum(1) > 1)
+            if not playing.size:
+                break
+            self.board_size[playing] = BOARD_SIZES[stage]
+            self.betting_round(playing)
+
+        if self.record:
+            pots, payout_chips = self.pots.copy(), self.chips.copy()
+        settled, ranks = self.determine_winner()
+        for seat, bot in enumerate(self.bots):
+            if isinstance(bot, BatchQLearningBot):
+                tables = np.flatnonzero(settled)
+                bot.receive_rewards(tables, self.chips[tables, seat] - self.starting_chips[tables, seat])
+        if self.record:
+            self.record_hands(pots, payout_chips, ranks)
+        self.rebuy()
+        self.dealer_position = (self.dealer_position + 1) % self.num_seats
+        self.rounds_played += 1
+
+    def reset_for_new_round(self):
+        self.pots[:] = 0
+        self.pot[:] = 0
+        self.pot_index[:] = 0
+        self.current_bet[:] = 0
+        self.bets[:] = 0
+        self.folded[:] = False
+        self.playpot[:] = 0
+        self.board_size[:] = 0
+        if self.record:
+            for actions in self.hand_actions:
+                actions.clear()
+
+    def deal_hands(self):
+        # the first cards of a random permutation of the deck, hole cards seat by seat then the board
+        deck = self.rng.random((self.num_tables, len(CARDS))).argsort(axis=1)
+        self.hands[:] = deck[:, :2 * self.num_seats].reshape(self.num_tables, self.num_seats, 2)
+        self.board[:] = deck[:, 2 * self.num_seats:2 * self.num_seats + 5]
+
+    def post_blinds(self):
+        small_blind_position = (self.dealer_position + 1) % self.num_seats
+        big_blind_position = (self.dealer_position + 2) % self.num_seats
+        for seat, blind in ((small_blind_position, self.small_blind), (big_blind_position, self.big_blind)):
+            if (self.chips[:, seat] < blind).any():
+                raise ValueError(f"{self.bots[seat].name} does not have enough chips to post {blind}")
+            self.chips[:, seat] -= blind
+            self.bets[:, seat] += blind
+        self.pots[:, 0] += self.small_blind + self.big_blind
+        self.pot += self.small_blind + self.big_blind
+        self.current_bet[:] = self.big_blind
+
+    def betting_round(self, tables):
+        num_seats = self.num_seats
+        start_position = (self.dealer_position + (3 if self.stage == 0 else 1)) % num_seats
+        self.current[tables] = start_position
+        self.last_to_act[tables] = (start_position - 1) % num_seats
+        self.all_in_action[tables] = False
+        self.bb_acted[tables] = False
+        self.history[tables] = EMPTY_HISTORY
+        self.strengths[tables] = -1
+        active = ~self.folded[tables] & (self.chips[tables] > 0)
+        self.active[tables] = active
+        self.live[tables] = active
+
+        # if only one seat can act, it does not act
+        going = tables[active.sum(1) > 1]
+        while going.size:
+            seats = self.current[going]
+            to_act = self.live[going, seats]
+            for seat in range(num_seats):
+                turns = going[to_act & (seats == seat)]
+                if turns.size:
+                    self.take_turns(turns, seat)
+            bets_settled = (~self.active[going] | self.folded[going] | (self.chips[going] == 0)
+                            | (self.bets[going] == self.current_bet[going, None])).all(1)
+            # preflop the small blind closing the action still waits for the big blind to act
+            sb_waits = (self.stage == 0) & ((seats - self.dealer_position) % num_seats == 1) & ~self.bb_acted[going]
+            done = (seats == self.last_to_act[going]) & bets_settled & ~sb_waits
+            self.current[going] = (seats + 1) % num_seats
+            # no more action needed, at most one seat left to act
+            done |= self.live[going].sum(1) <= 1
+            going = going[~done]
+
+        self.bets[tables] = 0
+        self.current_bet[tables] = 0
+        all_in = tables[self.all_in_action[tables]]
+        if all_in.size:
+            self.pot_index[all_in] += 1 # other players get entitled to the next side pot
+            entitled = ~self.folded[all_in] & (self.chips[all_in] > 0)
+            self.playpot[all_in] = np.where(entitled, self.pot_index[all_in, None], self.playpot[all_in])
+
+    def legal_actions(self, tables, seat, effective_stack):
+        """PokerGame.legal_actions at each of tables, and the chips each raise would add."""
+        player_chips = self.chips[tables, seat]
+        player_bet = self.bets[tables, seat]
+        current_bet = self.current_bet[tables]
+        call_amount = current_bet - player_bet
+        legal = np.where(player_bet < current_bet, 1 << FOLD, 0)
+        legal |= np.where(player_bet == current_bet, 1 << CHECK, np.where(player_chips > 0, 1 << CALL, 0))
+        can_raise = player_chips > current_bet
+        raise_amounts = {}
+        # Pre-Flop only raises the pot, Post-Flop also half of it
+        for raise_action in (RAISE_50, RAISE_100) if self.stage else (RAISE_100,):
+            amount = (RAISE_PERCENTAGES[raise_action] / 100) * self.pot[tables]
+            legal |= np.where(can_raise & (amount <= effective_stack - call_amount), 1 << raise_action, 0)
+            raise_amounts[raise_action] = amount.astype(np.int64)
+        legal |= np.where(can_raise, 1 << ALL_IN, 0)
+        return np.where(player_chips <= 0, 1 << CHECK, legal), call_amount, raise_amounts
+
+    def take_turns(self, tables, seat):
+        """Seat acts at each of tables, as one turn of PokerGame.betting_round."""
+        chips_before = self.chips[tables, seat]
+        opponents = self.active[tables]
+        opponents[:, seat] = False
+        max_opponent_stack = np.where(opponents, self.chips[tables], 0).max(1)
+        effective_stack = np.minimum(chips_before, max_opponent_stack)
+        legal, call_amount, raise_amounts = self.legal_actions(tables, seat, effective_stack)
+        actions = np.asarray(self.bots[seat].act(Observations(self, tables, seat, legal, effective_stack, call_amount)),
+                             dtype=np.int64)
+        # after an all-in the others can only call or fold
+        actions = np.where(self.all_in_action[tables] & (actions != FOLD), CALL, actions)
+
+        self.folded[tables[actions == FOLD], seat] = True
+        self.call_bet(tables[actions == CALL], seat)
+        pushed = actions == ALL_IN
+        if pushed.any():
+            push = tables[pushed]
+            amount = effective_stack[pushed]
+            if self.stage == 0:
+                self.call_bet(push, seat)
+                amount = np.minimum(self.chips[push, seat], max_opponent_stack[pushed])
+            self.raise_bet(push, seat, amount)
+            self.all_in_action[push] = True
+            self.last_to_act[push] = (seat - 1) % self.num_seats
+        for raise_action, amount in raise_amounts.items():
+            raised = actions == raise_action
+            if raised.any():
+                raise_tables = tables[raised]
+                self.call_bet(raise_tables, seat)
+                self.raise_bet(raise_tables, seat, amount[raised])
+                self.last_to_act[raise_tables] = (seat - 1) % self.num_seats
+
+        position = (seat - self.dealer_position) % self.num_seats
+        self.history[tables] = self.history[tables] << 7 | (position << 3 | actions).astype(object)
+        if position == 2:
+            self.bb_acted[tables] = True
+        if self.record:
+            for table, action, amount in zip(tables.tolist(), actions.tolist(),
+                                             (chips_before - self.chips[tables, seat]).tolist()):
+                self.hand_actions[table].append((STAGES[self.stage], seat, action, amount))
+        out = tables[self.folded[tables, seat] | (self.chips[tables, seat] == 0)]
+        self.live[out, seat] = False
+
+    def call_bet(self, tables, seat):
+        need = self.current_bet[tables] - self.bets[tables, seat]
+        chips = self.chips[tables, seat]
+        covered = chips >= need
+        calls = tables[covered]
+        self.chips[calls, seat] -= need[covered]
+        self.bets[calls, seat] += need[covered]
+        self.add_to_pot(calls, need[covered])
+        short = tables[~covered]
+        if short.size:
+            # all-in for less: bets above the caller's go back to the seats that made them
+            self.bets[short, seat] += chips[~covered]
+            self.chips[short, seat] = 0
+            called = self.bets[short, seat]
+            excess = self.bets[short] - called[:, None]
+            refunded = ~self.folded[short] & (excess > 0)
+            refunded[:, seat] = False
+            excess = np.where(refunded, excess, 0)
+            self.add_to_pot(short, -excess.sum(1))
+            self.chips[short] += excess
+            self.live[short] |= refunded
+            self.bets[short] = np.where(refunded, called[:, None], self.bets[short])
+            self.current_bet[short] = called
+            self.add_to_pot(short, called)
+
+    def raise_bet(self, tables, seat, amount):
+        self.chips[tables, seat] -= amount
+        self.bets[tables, seat] += amount
+        self.current_bet[tables] += amount
+        self.add_to_pot(tables, amount)
+
+    def add_to_pot(self, tables, amount):
+        self.pots[tables, self.pot_index[tables]] += amount
+        self.pot[tables] += amount
+
+    def hand_strengths(self, observations):
+        """evaluate_hand_strength of the acting seat at each table of observations, worked out
+        once per street: the preflop table, then equity against the seats still in the hand."""
+        tables, seat = observations.tables, observations.seat
+        strengths = self.strengths[tables, seat]
+        missing = strengths < 0
+        if missing.any():
+            rows = tables[missing]
+            hands = self.hands[rows, seat]
+            num_opponents = np.maximum(1, (~self.folded[rows]).sum(1) - 1)
+            if self.stage == 0:
+                values = PREFLOP_STRENGTHS[np.minimum(num_opponents, MAX_OPPONENTS) - 1, hand_classes(hands)]
+            else:
+                boards = np.where(np.arange(5) < self.board_size[rows, None], self.board[rows], -1)
+                equities = batch_equity(hands, boards, self.equity_samples, num_opponents, num_threads=0)
+                values = (equities * 20).astype(np.intp)
+            self.strengths[rows, seat] = values
+            strengths[missing] = values
+        return strengths
+
+    def showdown_ranks(self):
+        """Hand strength of every seat at the tables that dealt the river, 0 elsewhere."""
+        ranks = np.zeros((self.num_tables, self.num_seats), dtype=np.intc)
+        river = np.flatnonzero(self.board_size == 5)
+        boards = np.broadcast_to(self.board[river, None], (len(river), self.num_seats, 5))
+        cards = np.concatenate([self.hands[river], boards], axis=2).reshape(-1, 7)
+        ranks[river] = evaluate_hands(cards).reshape(len(river), self.num_seats)
+        return ranks
+
+    def determine_winner(self):
+        """Pay out the pots like PokerGame.determine_winner. Returns which tables settled (one
+        stops without rewards at a pot nobody is entitled to) and the showdown ranks, if any."""
+        settled = np.ones(self.num_tables, dtype=bool)
+        in_hand = ~self.folded
+        ranks = None
+        for i in range(self.pots.shape[1]):
+            pot = self.pots[:, i]
+            paid = (pot != 0) & settled
+            if not paid.any():
+                continue
+            entitled = in_hand & (self.playpot >= i) & paid[:, None]
+            count = entitled.sum(1)
+            settled &= ~(paid & (count == 0))
+            single = np.flatnonzero(count == 1)
+            self.chips[single, entitled[single].argmax(1)] += pot[single]
+            showdown = np.flatnonzero(count > 1)
+            if showdown.size:
+                if ranks is None:
+                    ranks = self.showdown_ranks()
+                contested = np.where(entitled[showdown], ranks[showdown], -1)
+                winners = contested == contested.max(1)[:, None]
+                split_pot = pot[showdown] // winners.sum(1)
+                self.chips[showdown] += np.where(winners, split_pot[:, None], 0)
+            pot[count > 0] = 0
+        return settled, ranks
+
+    def rebuy(self):
+        """check_rebuy of every seat in seat order, the rule all the bots in this repo share."""
+        for seat, initial_chips in enumerate(self.initial_chips.tolist()):
+            broke = np.flatnonzero(self.chips[:, seat] <= self.big_blind)
+            if not broke.size:
+                continue
+            # take chips from the deepest stack
+            deep = self.chips[broke].argmax(1)
+            taken = self.chips[broke, deep] > 3 * initial_chips
+            self.chips[broke[taken], deep[taken]] = initial_chips
+            self.score[broke[taken], deep[taken]] += 2
+            self.chips[broke, seat] = initial_chips
+            self.score[broke, seat] -= 1
+
+    def record_hands(self, pots, payout_chips, ranks):
+        seats = [bot.name for bot in self.bots]
+        for table in range(self.num_tables):
+            showdown = self.board_size[table] == 5 and (~self.folded[table]).sum() > 1
+            showdown_ranks = [int(rank) if showdown and not folded else 0
+                              for rank, folded in zip(ranks[table], self.folded[table])] if ranks is not None else [0] * self.num_seats
+            chips = self.chips[table].tolist()
+            self.recorded_hands.append(Hand(
+                seats, self.rounds_played * self.num_tables + table, self.dealer_position,
+                self.small_blind, self.big_blind, [CARDS[card] for card in self.board[table, :self.board_size[table]]],
+                pots[table].tolist(), self.starting_chips[table].tolist(),
+                [[CARDS[card] for card in hand] for hand in self.hands[table].tolist()],
+                [after - before for after, before in zip(chips, payout_chips[table].tolist())], chips,
+                showdown_ranks, list(self.hand_actions[table])))
+
+def cross_check(hands):
+    """Replay recorded hands (BatchPokerGame with record=True, or hand_history.read_hands)
+    through PokerGame. Returns the hands that play out differently there: other chips after
+    the payout, or a different number of actions. An empty list means the engines agree."""
+    mismatches = []
+    for hand in hands:
+        game = replay_game(hand)
+        game.log_level = OFF
+        try:
+            game.play_round()
+        except StopIteration: # PokerGame asked a seat for more actions than it took
+            mismatches.append(hand)
+            continue
+        if ([player.chips for player in game.players] != hand.final_chips
+                or any(next(player.recorded_actions, None) is not None for player in game.players)):
+            mismatches.append(hand)
+    return mismatches
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play many tables at once with the batch engine.')
+    parser.add_argument('--tables', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=100, help='hands played at every table')
+    parser.add_argument('--bots', choices=['random', 'honest', 'training'], default='random',
+                        help='three random bots, three honest bots, or the training mix of one honest and two Q-learning bots')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--cross-check', action='store_true', help='replay every hand through PokerGame and compare the chips')
+    args = parser.parse_args()
+
+    if args.bots == 'random':
+        bots = [BatchRandomBot(f"Random_{i}") for i in range(3)]
+    elif args.bots == 'honest':
+        bots = [BatchHonestBot(f"Honest_{i}") for i in range(3)]
+    else:
+        q_table = ArrayQTable()
+        bots = [BatchHonestBot("Honest_Hannah"), BatchQLearningBot("Bot_Ricky", q_table), BatchQLearningBot("Bot_Bob", q_table)]
+    engine = BatchPokerGame(bots, args.tables, seed=args.seed, record=args.cross_check)
+    start_time = time.perf_counter()
+    engine.play_game(args.rounds)
+    elapsed_time = time.perf_counter() - start_time
+    hands = args.tables * args.rounds
+    print(f"{hands} hands in {elapsed_time:.2f}s, {hands / elapsed_time * 60:,.0f} hands per minute")
+    print('Scores:', dict(zip(engine.score_log, engine.score.sum(0).tolist())))
+    if args.cross_check:
+        mismatches = cross_check(engine.recorded_hands)
+        print(f"Cross-check: {len(mismatches)} of {hands} hands differ in PokerGame")
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import hand_rank_monte_carlo
+from hand_rank_monte_carlo import get_best_hand, evaluate_hands, monte_carlo_simulation
+from batch_bots import BatchRandomBot
+from batch_engine import BatchPokerGame
+from checkpoint import TrackedQTable
+from game_log import OFF
+from honest_bot import HonestBot
+from poker_game import PokerGame
+from q_table import ArrayQTable, MappedQTable, load_q_table, save_q_table
+from random_bot import RandomBot
+from rl_bot import QLearningBot
+from state_encoding import EMPTY_HISTORY, STAGES, append_action, encode_state
+from utils import CARDS, equity_cache, evaluate_hand_strength
+
+# Every benchmark times a fixed, seeded workload `repeat` times and reports the time of one
+# operation in it (a hand evaluated, a simulation run, a round played, ...) as median and
+# percentiles over the repeats, so two JSON reports can be compared benchmark by benchmark.
+BOARD_SIZES = {'Pre-Flop': 0, 'Flop': 3, 'Turn': 4, 'River': 5}
+BOT_MIXES = {
+    'random': lambda q_table: [RandomBot(f"Random_{i}", 1000) for i in range(3)],
+    'honest': lambda q_table: [HonestBot(f"Honest_{i}", 1000) for i in range(3)],
+    'training': lambda q_table: [HonestBot("Honest_Hannah", 1000),
+                                 QLearningBot("Bot_Ricky", 1000, shared_q_table=q_table),
+                                 QLearningBot("Bot_Bob", 1000, shared_q_table=q_table)],
+    'q_learning': lambda q_table: [QLearningBot(f"Bot_{i}", 1000, shared_q_table=q_table) for i in range(3)],
+}
+
+def timings(function, repeat, setup=None):
+    """Seconds taken by each of repeat calls to function, after one untimed warm-up call.
+    setup, if given, runs untimed before every call."""
+    times = []
+    for i in range(repeat + 1):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        function()
+        if i:
+            times.append(time.perf_counter() - start_time)
+    return times
+
+def summary(times, operations=1):
+    per_operation = np.array(times) / operations
+    median = float(np.median(per_operation))
+    return {
+        'median': median,
+        'p10': float(np.percentile(per_operation, 10)),
+        'p90': float(np.percentile(per_operation, 90)),
+        'min': float(per_operation.min()),
+        'max': float(per_operation.max()),
+        'repeat': len(times),
+        'operations': operations,
+        'per_second': 1 / median if median else None,
+    }
+
+def random_spots(rng, count, board_size):
+    cards = [rng.sample(range(len(CARDS)), 2 + board_size) for _ in range(count)]
+    return [([CARDS[card] for card in spot[:2]], [CARDS[card] for card in spot[2:]]) for spot in cards]
+
+def bench_evaluator(results, rng, repeat, scale):
+    spots = random_spots(rng, 10000 // scale, 5)
+    results['evaluator/get_best_hand'] = summary(
+        timings(lambda: [get_best_hand(hand, board) for hand, board in spots], repeat), len(spots))
+    cards = np.array([hand + board for hand, board in spots])
+    results['evaluator/evaluate_hands'] = summary(timings(lambda: evaluate_hands(cards), repeat), len(spots))
+
+def bench_monte_carlo(results, rng, repeat, scale):
+    for stage, board_size in BOARD_SIZES.items():
+        spots = random_spots(rng, 20 // scale, board_size)
+        for num_simulations in (100, 1000, 10000):
+            results[f'monte_carlo/{stage}/{num_simulations}'] = summary(timings(
+                lambda: [monte_carlo_simulation(hand, board, num_simulations, 2) for hand, board in spots],
+                repeat), len(spots))
+
+def bench_hand_strength(results, rng, repeat, scale):
+    game = PokerGame([HonestBot(f"Honest_{i}", 1000) for i in range(3)])
+    player = game.players[0]
+    def evaluate(spots):
+        for hand, board in spots:
+            player.hand = hand
+            game.community_cards = board
+            evaluate_hand_strength(game, player, game.equity_samples)
+    for stage, board_size in BOARD_SIZES.items():
+        spots = random_spots(rng, 2000 // scale if board_size == 0 else 200 // scale, board_size)
+        # cold: every equity simulated, warm: every equity from the cache
+        results[f'hand_strength/{stage}/cold'] = summary(
+            timings(lambda: evaluate(spots), repeat, setup=equity_cache.memory.clear), len(spots))
+        if board_size:
+            results[f'hand_strength/{stage}/warm'] = summary(timings(lambda: evaluate(spots), repeat), len(spots))
+    equity_cache.memory.clear()
+
+def bench_play_round(results, rng, repeat, scale):
+    # the Q-learning mixes run on the dict Q-table training uses by default, and again on
+    # the ArrayQTable of --array-q-table
+    variants = [(mix, players, TrackedQTable) for mix, players in BOT_MIXES.items()]
+    variants += [(f'{mix}/array', BOT_MIXES[mix], ArrayQTable) for mix in ('training', 'q_learning')]
+    for name, players, q_table in variants:
+        game = PokerGame(players(q_table()))
+        game.log_level = OFF
+        game.verbose = False
+        rounds = 200 // scale
+        def play():
+            for _ in range(rounds):
+                game.play_round()
+        results[f'play_round/{name}'] = summary(timings(play, repeat), rounds)
+        equity_cache.memory.clear()
+
+def bench_batch_engine(results, rng, repeat, scale):
+    engine = BatchPokerGame([BatchRandomBot(f"Random_{i}") for i in range(3)], 10000 // scale, seed=rng.randrange(1 << 32))
+    rounds = 10
+    results['batch_engine/random'] = summary(timings(lambda: engine.play_game(rounds), repeat),
+                                             rounds * engine.num_tables)
+
+def random_q_table(rng, entries):
+    """Q-table of entries random but well formed states and values."""
+    q_table = {}
+    while len(q_table) < entries:
+        history = EMPTY_HISTORY
+        for _ in range(rng.randrange(6)):
+            history = append_action(history, rng.randrange(3), rng.randrange(6))
+        state = encode_state(rng.choice(STAGES), rng.randrange(3), rng.randrange(21), history)
+        q_table[(state, rng.randrange(6))] = rng.uniform(-1000, 1000)
+    return q_table
+
+def bench_q_table(results, rng, repeat, scale):
+    q_table = random_q_table(rng, 200000 // scale)
+    keys = rng.sample(list(q_table), min(len(q_table), 10000))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'q_table.bin')
+        results['q_table/save'] = summary(timings(lambda: save_q_table(q_table, path), repeat), len(q_table))
+        results['q_table/load'] = summary(timings(lambda: load_q_table(path), repeat), len(q_table))
+        table = MappedQTable(path)
+        results['q_table/mapped_get'] = summary(timings(lambda: [table.get(key) for key in keys], repeat), len(keys))
+        table.close()
+    array_table = ArrayQTable(q_table)
+    results['q_table/array_get'] = summary(timings(lambda: [array_table.get(key) for key in keys], repeat), len(keys))
+
+BENCHMARKS = {
+    'evaluator': bench_evaluator,
+    'monte_carlo': bench_monte_carlo,
+    'hand_strength': bench_hand_strength,
+    'play_round': bench_play_round,
+    'batch_engine': bench_batch_engine,
+    'q_table': bench_q_table,
+}
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'numpy': np.__version__,
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+def compare(results, baseline_path):
+    """Print each benchmark's median against the one in an earlier report."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['benchmarks']
+    for name, stats in results.items():
+        if name in baseline:
+            ratio = stats['median'] / baseline[name]['median']
+            flag = '  slower' if ratio > 1.1 else '  faster' if ratio < 0.9 else ''
+            print(f"{name:40} {baseline[name]['median'] * 1e6:12.2f}us -> {stats['median'] * 1e6:12.2f}us  x{ratio:.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the evaluator, simulator, game engines and Q-table files.')
+    parser.add_argument('--output', default='./outputs/benchmark.json', help='where to write the JSON report')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='run only these groups')
+    parser.add_argument('--repeat', type=int, default=7, help='timed runs of each workload')
+    parser.add_argument('--quick', action='store_true', help='workloads a tenth of the size, for a smoke test')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', metavar='REPORT', help='earlier JSON report to compare the medians with')
+    args = parser.parse_args()
+
+    scale = 10 if args.quick else 1
+    results = {}
+    for name in args.only or BENCHMARKS:
+        # each group gets the same seeds whichever other groups run
+        random.seed(args.seed)
+        hand_rank_monte_carlo.seed(args.seed)
+        start_time = time.perf_counter()
+        BENCHMARKS[name](results, random.Random(args.seed), args.repeat, scale)
+        print(f"{name}: {time.perf_counter() - start_time:.1f}s")
+
+    report = {
+        'machine': machine_info(),
+        'settings': {'repeat': args.repeat, 'quick': args.quick, 'seed': args.seed},
+        'benchmarks': results,
+    }
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, stats in results.items():
+        print(f"{name:40} median {stats['median'] * 1e6:12.2f}us  p90 {stats['p90'] * 1e6:12.2f}us  {stats['per_second']:14,.0f}/s")
+    print(f"Report written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from q_table import MappedQTable, as_tuple, load_q_table, save_q_table
+
+# q_table.bin.wal: one frame per checkpoint, appended after the last snapshot. A frame is a
+# header (magic, crc32 of the payload, checkpoint sequence, round, payload length) and a JSON
+# payload [[state, action, value], ...] of the entries changed since the previous checkpoint.
+# A frame cut short by a crash fails its crc and ends the log.
+FRAME_HEADER = struct.Struct('<4sIQQI')
+FRAME_MAGIC = b'WAL1'
+
+def wal_path(path):
+    return path + '.wal'
+
+class TrackedQTable(dict):
+    """dict Q-table that remembers which keys were written since the last checkpoint."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def __reduce__(self):
+        # dict's default pickling restores the items through __setitem__ before dirty exists,
+        # so rebuild from a plain dict instead, e.g. when train_parallel spawns its workers
+        return TrackedQTable, (dict(self),), {'dirty': self.dirty}
+
+    def take_dirty(self):
+        """Changed entries since the last call, as a list of (state, action, value)."""
+        entries = [(state, action, self[(state, action)]) for state, action in self.dirty]
+        self.dirty = set()
+        return entries
+
+def read_wal(path):
+    """Yield (sequence, round_number, entries) for every intact frame of path's log."""
+    try:
+        f = open(wal_path(path), 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            magic, crc, sequence, round_number, length = FRAME_HEADER.unpack(header)
+            payload = f.read(length)
+            if magic != FRAME_MAGIC or len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield sequence, round_number, json.loads(payload)
+
+def resume_q_table(path):
+    """Rebuild the latest Q-table from the snapshot at path plus the frames logged after it.
+    Returns (TrackedQTable, sequence, round_number) of the last checkpoint, zeros if none."""
+    q_table, sequence, round_number = TrackedQTable(), 0, 0
+    if os.path.exists(path):
+        table = MappedQTable(path)
+        sequence, round_number = table.sequence, table.round_number
+        table.close()
+        q_table = TrackedQTable(load_q_table(path))
+    for frame_sequence, frame_round, entries in read_wal(path):
+        if frame_sequence <= sequence:
+            continue # already part of the snapshot
+        for state, action, value in entries:
+            dict.__setitem__(q_table, (as_tuple(state), as_tuple(action)), value)
+        sequence, round_number = frame_sequence, frame_round
+    return q_table, sequence, round_number
+
+def write_snapshot(q_table, path, sequence, round_number):
+    """Save q_table as checkpoint sequence and empty the log, whose frames it includes."""
+    save_q_table(q_table, path, sequence, round_number)
+    open(wal_path(path), 'wb').close()
+
+class QTableCheckpointer:
+    """Checkpoints a TrackedQTable or ArrayQTable during a long run. checkpoint() hands the entries changed
+    since the previous one to a background thread, which appends them to the log; every
+    compact_every checkpoints the thread writes a fresh snapshot and empties the log."""
+    def __init__(self, q_table, path, compact_every=20, sequence=0):
+        self.q_table = q_table
+        self.path = path
+        self.compact_every = compact_every
+        self.sequence = sequence
+        self.since_compaction = 0
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def checkpoint(self, round_number):
+        self.sequence += 1
+        self.since_compaction += 1
+        if self.since_compaction >= self.compact_every:
+            self.compact(round_number)
+        else:
+            self.jobs.put(('append', self.sequence, round_number, self.q_table.take_dirty()))
+
+    def compact(self, round_number):
+        self.q_table.dirty = set()
+        self.since_compaction = 0
+        # a copy of the dict or of ArrayQTable's arrays, the slow part of a snapshot is left to the thread
+        self.jobs.put(('compact', self.sequence, round_number, self.q_table.copy()))
+
+    def close(self, round_number):
+        """Write a final snapshot and wait for the background thread to finish."""
+        self.sequence += 1
+        self.compact(round_number)
+        self.jobs.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            kind, sequence, round_number, data = job
+            if kind == 'append':
+                payload = json.dumps(data).encode()
+                with open(wal_path(self.path), 'ab') as f:
+                    f.write(FRAME_HEADER.pack(FRAME_MAGIC, zlib.crc32(payload), sequence, round_number, len(payload)))
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                # every frame queued before this job is in the snapshot, so the log can go
+                write_snapshot(data, self.path, sequence, round_number)
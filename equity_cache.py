@@ -0,0 +1,136 @@
+import mmap
+import os
+import struct
+from collections import OrderedDict
+
+# disk layout: 16 byte header, then open-addressing slots of (key, equity, check)
+HEADER = struct.Struct('<4sI8x')
+SLOT = struct.Struct('<QdQ')
+MAGIC = b'EQC1'
+MAX_PROBES = 16
+
+def create_cache_file(path, disk_slots=1 << 22):
+    """Create an empty cache file with disk_slots slots at path unless there is one. It is built
+    full size under a name of this process and hard linked into place, which fails if the path
+    exists, so a process opening the path meanwhile sees no file or a whole one, and a file
+    another process has mapped is never replaced or truncated."""
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, disk_slots))
+        f.truncate(HEADER.size + disk_slots * SLOT.size)
+    try:
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass # another process created it first, everyone maps that one
+    finally:
+        os.remove(temp_path)
+
+class EquityCache:
+    """Equity by canonical (hand, board) key, see hand_rank_monte_carlo.canonical_key.
+    Lookups go through a bounded in-memory LRU first and then, if one is opened,
+    a memory-mapped hash table on disk that every worker process can map at once."""
+    def __init__(self, max_entries=200000, path=None, disk_slots=1 << 22):
+        self.memory = OrderedDict()
+        self.max_entries = max_entries
+        self.disk = None
+        self.disk_slots = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evaluations = 0
+        self.eval_time = 0.0 # seconds spent computing the equities put in the cache
+        if path:
+            self.open_disk(path, disk_slots)
+
+    def open_disk(self, path, disk_slots=1 << 22):
+        """Map the cache file at path, creating it with disk_slots slots (a power of two) if needed."""
+        create_cache_file(path, disk_slots)
+        with open(path, 'r+b') as f:
+            self.disk = mmap.mmap(f.fileno(), 0)
+        magic, self.disk_slots = HEADER.unpack_from(self.disk, 0)
+        if magic != MAGIC:
+            self.disk.close()
+            self.disk = None
+            raise ValueError(f"{path} is not an equity cache file")
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.flush()
+            self.disk.close()
+            self.disk = None
+
+    def _slot_offsets(self, key):
+        index = (key * 0x9E3779B97F4A7C15 >> 20) & (self.disk_slots - 1)
+        for probe in range(MAX_PROBES):
+            yield HEADER.size + ((index + probe) & (self.disk_slots - 1)) * SLOT.size
+
+    def _check(self, key, equity):
+        # a slot written by two processes at once fails this check and reads as empty
+        return key ^ struct.unpack('<Q', struct.pack('<d', equity))[0]
+
+    def _disk_get(self, key):
+        for offset in self._slot_offsets(key):
+            slot_key, equity, check = SLOT.unpack_from(self.disk, offset)
+            if slot_key == 0:
+                return None
+            if slot_key == key:
+                return equity if check == self._check(key, equity) else None
+        return None
+
+    def _disk_put(self, key, equity):
+        for offset in self._slot_offsets(key):
+            slot_key = SLOT.unpack_from(self.disk, offset)[0]
+            if slot_key == 0 or slot_key == key:
+                SLOT.pack_into(self.disk, offset, key, equity, self._check(key, equity))
+                return
+        # probe chain full, keep it in memory only
+
+    def _remember(self, key, equity):
+        self.memory[key] = equity
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key, count=True):
+        """Cached equity for key or None. Prefetches pass count=False to keep the hit counters honest."""
+        equity = self.memory.get(key)
+        if equity is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += count
+            return equity
+        if self.disk is not None:
+            equity = self._disk_get(key)
+            if equity is not None:
+                self.disk_hits += count
+                self._remember(key, equity)
+                return equity
+        self.misses += count
+        return None
+
+    def put(self, key, equity, eval_time=0.0):
+        self.evaluations += 1
+        self.eval_time += eval_time
+        self._remember(key, equity)
+        if self.disk is not None:
+            self._disk_put(key, equity)
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        mean_eval_time = self.eval_time / self.evaluations if self.evaluations else 0.0
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'eval_time': self.eval_time,
+            'saved_time': hits * mean_eval_time, # estimated from the mean cost of a miss
+        }
+
+    def __repr__(self):
+        stats = self.stats()
+        return (f"EquityCache(hits: {stats['memory_hits']} memory + {stats['disk_hits']} disk, "
+                f"misses: {stats['misses']}, hit rate: {stats['hit_rate']:.1%}, "
+                f"saved ~{stats['saved_time']:.1f}s)")
@@ -0,0 +1,37 @@
+DEBUG, INFO, WARNING, OFF = 10, 20, 30, 100
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'off': OFF}
+
+class GameLog:
+    """Events logged by a PokerGame, kept as (template, args) and only formatted with
+    str.format when written out. Without a sink they stay in memory; open_sink(path) streams
+    them to path instead, writing every chunk_events events so memory stays bounded."""
+    def __init__(self, chunk_events=10000):
+        self.events = []
+        self.sink = None
+        self.chunk_events = chunk_events
+
+    def open_sink(self, path):
+        self.close()
+        self.sink = open(path, 'w')
+
+    def add(self, template, args):
+        self.events.append((template, args))
+        if self.sink is not None and len(self.events) >= self.chunk_events:
+            self.flush()
+
+    def lines(self):
+        return [template.format(*args) for template, args in self.events]
+
+    def flush(self):
+        if self.sink is not None:
+            self.sink.write(''.join(line + '\n' for line in self.lines()))
+            self.events = []
+
+    def close(self):
+        if self.sink is not None:
+            self.flush()
+            self.sink.close()
+            self.sink = None
+
+    def __len__(self):
+        return len(self.events)
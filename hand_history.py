@@ -0,0 +1,165 @@
+import glob
+import gzip
+import struct
+from hand_rank_monte_carlo import evaluate_hand
+from player import Player
+from poker_game import PokerGame
+from state_encoding import STAGES
+from utils import CARDS, Deck
+
+# A hand history is a rolling set of files prefix.00000.hh, prefix.00001.hh, ... (.hh.gz when
+# compressed), each holding up to hands_per_file hands. A file starts with a header (magic,
+# version, number of seats) and the seat names, each a length byte and utf-8. Every hand then
+# is a fixed HAND header, one SEAT entry per seat and num_actions ACTION entries:
+#   HAND:   hand number, dealer seat, small blind, big blind, number of actions, number of
+#           board cards, 5 board cards (NO_CARD past the end), the 6 pots before the payout
+#   SEAT:   chips before the blinds, 2 hole cards, chips won from the pots, chips after the
+#           hand, showdown hand strength (0 if the seat did not show down)
+#   ACTION: stage, seat, action code (actions.py), chips the seat put in with it
+FILE_HEADER = struct.Struct('<4sHB')
+FILE_MAGIC = b'HHS1'
+HAND = struct.Struct('<QBIIHB5B6i')
+SEAT = struct.Struct('<iBBiiI')
+ACTION = struct.Struct('<BBBi')
+NO_CARD = 255
+
+class Hand:
+    """One recorded hand, as read back by read_hands."""
+    def __init__(self, seats, number, dealer, small_blind, big_blind, board, pots, starting_chips,
+                 hole_cards, won, final_chips, showdown_ranks, actions):
+        self.seats = seats # seat names
+        self.number = number
+        self.dealer = dealer
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.board = board # list of Card
+        self.pots = pots
+        self.starting_chips = starting_chips
+        self.hole_cards = hole_cards # [Card, Card] per seat
+        self.won = won
+        self.final_chips = final_chips
+        self.showdown_ranks = showdown_ranks
+        self.actions = actions # (stage, seat, action, amount), stage as its name
+
+    def __repr__(self):
+        return f"Hand({self.number}, board: {self.board}, actions: {len(self.actions)}, won: {self.won})"
+
+class HandHistoryWriter:
+    """Records every hand a PokerGame plays once it is set as game.hand_history. Files already
+    under prefix, e.g. those of a run being resumed, are kept and new files numbered after them."""
+    def __init__(self, prefix, seat_names, hands_per_file=100000, compress=False):
+        self.prefix = prefix
+        self.seat_names = [name.encode() for name in seat_names]
+        self.hands_per_file = hands_per_file
+        self.compress = compress
+        self.hands_written = 0
+        self.file = None
+        existing = history_files(prefix)
+        self.file_index = int(existing[-1][len(prefix) + 1:len(prefix) + 6]) + 1 if existing else 0
+
+    def _open_next(self):
+        self.close()
+        path = f"{self.prefix}.{self.file_index:05d}.hh" + ('.gz' if self.compress else '')
+        self.file = gzip.open(path, 'wb', compresslevel=6) if self.compress else open(path, 'wb')
+        self.file_index += 1
+        self.file.write(FILE_HEADER.pack(FILE_MAGIC, 1, len(self.seat_names)))
+        for name in self.seat_names:
+            self.file.write(bytes([len(name)]) + name)
+
+    def record(self, game, starting_chips, pots, payout_chips):
+        """Write the hand game just settled. starting_chips are the chips of each seat before
+        the blinds, pots and payout_chips the pots and chips right before the payout."""
+        if self.file is None or self.hands_written % self.hands_per_file == 0:
+            self._open_next()
+        board = game.community_cards
+        showdown = len(board) == 5 and sum(not p.folded for p in game.players) > 1
+        record = [HAND.pack(self.hands_written, game.dealer_position, game.small_blind, game.big_blind,
+                            len(game.hand_actions), len(board), *board, *[NO_CARD] * (5 - len(board)), *pots)]
+        for player, chips, before_payout in zip(game.players, starting_chips, payout_chips):
+            rank = evaluate_hand(player.hand, board) if showdown and not player.folded else 0
+            record.append(SEAT.pack(chips, player.hand[0], player.hand[1], player.chips - before_payout, player.chips, rank))
+        for action in game.hand_actions:
+            record.append(ACTION.pack(*action))
+        self.file.write(b''.join(record))
+        self.hands_written += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def history_files(prefix):
+    return sorted(glob.glob(f"{glob.escape(prefix)}.[0-9][0-9][0-9][0-9][0-9].hh*"))
+
+def read_exactly(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise EOFError
+    return data
+
+def read_hand(f, seats):
+    header = HAND.unpack(read_exactly(f, HAND.size))
+    number, dealer, small_blind, big_blind, num_actions, num_board = header[:6]
+    board = [CARDS[card] for card in header[6:6 + num_board]]
+    pots = list(header[11:])
+    starting_chips, hole_cards, won, final_chips, showdown_ranks = [], [], [], [], []
+    for chips, card1, card2, seat_won, seat_final_chips, rank in SEAT.iter_unpack(read_exactly(f, SEAT.size * len(seats))):
+        starting_chips.append(chips)
+        hole_cards.append([CARDS[card1], CARDS[card2]])
+        won.append(seat_won)
+        final_chips.append(seat_final_chips)
+        showdown_ranks.append(rank)
+    actions = [(STAGES[stage], seat, action, amount)
+               for stage, seat, action, amount in ACTION.iter_unpack(read_exactly(f, ACTION.size * num_actions))]
+    return Hand(seats, number, dealer, small_blind, big_blind, board, pots, starting_chips,
+                hole_cards, won, final_chips, showdown_ranks, actions)
+
+def read_hands(prefix):
+    """Yield every Hand recorded under prefix, one at a time, file after file."""
+    for path in history_files(prefix):
+        with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as f:
+            magic, _, num_seats = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != FILE_MAGIC:
+                raise ValueError(f"{path} is not a hand history file")
+            seats = [read_exactly(f, f.read(1)[0]).decode() for _ in range(num_seats)]
+            while True:
+                try:
+                    hand = read_hand(f, seats)
+                except EOFError: # end of file, or a hand cut short by a crash
+                    break
+                yield hand
+
+class ReplayBot(Player):
+    """Plays back the recorded actions of one seat."""
+    __slots__ = ('recorded_actions',)
+
+    def __init__(self, name, chips, actions):
+        super().__init__(name, chips)
+        self.recorded_actions = iter(actions)
+
+    def get_action(self, game, current_position, effective_stack, legal_mask):
+        return next(self.recorded_actions)
+
+    def check_rebuy(self, game):
+        pass
+
+class ReplayDeck(Deck):
+    """Deck that deals the recorded hole cards and board in the order PokerGame deals them."""
+    def __init__(self, hand):
+        dealt = [card for cards in hand.hole_cards for card in cards] + hand.board
+        rest = [card for card in CARDS if card not in dealt]
+        self.cards = rest + dealt[::-1]
+        self.remaining = len(self.cards)
+
+    def deal(self):
+        self.remaining -= 1
+        return self.cards[self.remaining]
+
+def replay_game(hand):
+    """PokerGame set up at the start of hand, whose play_round() plays it again move by move."""
+    players = [ReplayBot(name, chips, [action for _, seat, action, _ in hand.actions if seat == i])
+               for i, (name, chips) in enumerate(zip(hand.seats, hand.starting_chips))]
+    game = PokerGame(players, hand.big_blind, hand.small_blind)
+    game.deck = ReplayDeck(hand)
+    game.dealer_position = hand.dealer
+    return game
@@ -1,287 +1,614 @@
 #cython: language_level=3
-from libc.stdlib cimport malloc, free, srand, rand, atoi
-from libc.string cimport memcpy, strcpy
-from libc.time cimport time
-from libc.stdio cimport printf
-from itertools import combinations
+from libc.stdlib cimport malloc, free
+from libc.string cimport memset, memcpy
+from cython.parallel cimport prange
+from itertools import combinations_with_replacement, permutations
+from array import array
+import os
 import cython
+import numpy as np
 
-cdef char SUITS[4]
-cdef char RANKS[13]
-
-def initialize_constants():
-    global SUITS, RANKS
-    SUITS[0] = b'h'[0]
-    SUITS[1] = b'd'[0]
-    SUITS[2] = b'c'[0]
-    SUITS[3] = b's'[0]
-    RANKS[0] = b'2'[0]
-    RANKS[1] = b'3'[0]
-    RANKS[2] = b'4'[0]
-    RANKS[3] = b'5'[0]
-    RANKS[4] = b'6'[0]
-    RANKS[5] = b'7'[0]
-    RANKS[6] = b'8'[0]
-    RANKS[7] = b'9'[0]
-    RANKS[8] = b'T'[0]
-    RANKS[9] = b'J'[0]
-    RANKS[10] = b'Q'[0]
-    RANKS[11] = b'K'[0]
-    RANKS[12] = b'A'[0]
-
-def setup_module():
-    initialize_constants()
-    srand(time(NULL))  # Seed the RNG once
+# --- 7-card lookup tables ---
+# Cards are ints indexed as rank * 4 + suit (rank 0-12 for 2..A, suit 0-3 for h, d, c, s),
+# the same encoding as utils.Card, so they are passed in without any conversion.
+# A hand strength is a single int: category << 20 followed by five 4-bit rank values
+# (2..14, ace counts as 1 in a wheel) in order of significance, so a bigger int is a better hand.
+# Flushes are looked up by the 13-bit rank mask of the flush suit, everything else by the
+# combinatorial index of the 7 ranks as a multiset (a perfect hash, no collisions).
 
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hand_rank_tables.bin')
+TABLE_MAGIC = b'HRT1'
 
-cpdef tuple get_best_hand(list player_hand, list community_cards):
-    cdef char combined_cards[7][2]
-    cdef char best_hand[5][2]
-    cdef int i, j
-
-    # Initialize the combined cards array
-    for i in range(2):
-        combined_cards[i][0] = player_hand[i][0].encode('utf-8')[0]
-        combined_cards[i][1] = player_hand[i][1].encode('utf-8')[0]
+cdef enum:
+    FLUSH_TABLE_SIZE = 8192  # 2 ** 13 rank masks
+    RANK_TABLE_SIZE = 50388  # C(19, 7) multisets of 7 ranks
+
+cdef int FLUSH_TABLE[FLUSH_TABLE_SIZE]
+cdef int RANK_TABLE[RANK_TABLE_SIZE]
+cdef int MULTISET_OFFSET[13][7]  # C(rank + i, i + 1), the colex weight of the i-th smallest rank
+
+
+cdef int binomial(int n, int k):
+    cdef int i, result = 1
+    if k < 0 or k > n:
+        return 0
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+def _pack_strength(int category, values):
+    strength = category
     for i in range(5):
-        combined_cards[i+2][0] = community_cards[i][0].encode('utf-8')[0]
-        combined_cards[i+2][1] = community_cards[i][1].encode('utf-8')[0]
-
-    # Initialize best rank and best hand
-    best_rank = (-1, ())
-    cdef char current_hand[5][2]
-
-    # Evaluate the best hand
-    for combination in combinations(range(7), 5):
-        for j in range(5):
-            current_hand[j][0] = combined_cards[combination[j]][0]
-            current_hand[j][1] = combined_cards[combination[j]][1]
-        current_rank = single_hand_rank(current_hand)  # Evaluate the rank of the current hand
-        if current_rank > best_rank:
-            best_rank = current_rank
-            for j in range(5):
-                best_hand[j][0] = current_hand[j][0]
-                best_hand[j][1] = current_hand[j][1]
-
-    return best_rank
-
-
-# Cython code with debugging print statements
-cpdef double monte_carlo_simulation(list player_hand, list community_cards, int num_simulations=1000):
-    setup_module()
-    cdef int i, j, wins = 0, total_community_cards = len(community_cards)
-    cdef int found, k
-    cdef char deck[52][2], shuffled_deck[52][2]
-    cdef char our_hand[2][2]
-    cdef char opponent_hand[2][2]
-    cdef char board[5][2]
-    cdef int num_cards = 0
-
-    cdef char combined_cards_us[7][2]
-    cdef char combined_cards_opps[7][2]
-    cdef char current_hand[5][2]
-
-    # Initialize deck
-    for i in range(52):
-        deck[i][0] = SUITS[i % 4]
-        deck[i][1] = RANKS[i // 4]
+        strength = (strength << 4) | (values[i] if i < len(values) else 0)
+    return strength
+
+
+def _straight_high(int mask):
+    """Value of the highest straight in a 13-bit rank mask, 0 if there is none."""
+    for high in range(12, 3, -1):
+        if (mask >> (high - 4)) & 0x1F == 0x1F:
+            return high + 2
+    if mask & 0x100F == 0x100F:  # A-2-3-4-5
+        return 5
+    return 0
 
-    # Parse player cards into C array
-    for i in range(2):
-        our_hand[i][0] = player_hand[i][0].encode('utf-8')[0]
-        our_hand[i][1] = player_hand[i][1].encode('utf-8')[0]
 
-    # Parse community cards into C array
+def _straight_values(int high):
+    return [5, 4, 3, 2, 1] if high == 5 else list(range(high, high - 5, -1))
+
+
+def _flush_strength(int mask):
+    """Best 5-card hand from a flush suit holding the ranks in mask, 0 if fewer than 5 ranks."""
+    values = [r + 2 for r in range(12, -1, -1) if mask & (1 << r)]
+    if len(values) < 5:
+        return 0
+    high = _straight_high(mask)
+    if high:
+        return _pack_strength(8, _straight_values(high))  # Straight flush
+    return _pack_strength(5, values[:5])  # Flush
+
+
+def _rank_strength(counts):
+    """Best non-flush 5-card hand from the rank counts of 7 cards."""
+    values = [r + 2 for r in range(12, -1, -1) if counts[r]]
+    quads = [r + 2 for r in range(12, -1, -1) if counts[r] == 4]
+    trips = [r + 2 for r in range(12, -1, -1) if counts[r] == 3]
+    pairs = [r + 2 for r in range(12, -1, -1) if counts[r] == 2]
+    if quads:
+        kicker = [v for v in values if v != quads[0]][:1]
+        return _pack_strength(7, [quads[0]] + kicker)  # Four of a kind
+    if trips and (len(trips) > 1 or pairs):
+        return _pack_strength(6, [trips[0], max(trips[1:] + pairs)])  # Full house
+    high = _straight_high(sum(1 << (v - 2) for v in values))
+    if high:
+        return _pack_strength(4, _straight_values(high))  # Straight
+    if trips:
+        return _pack_strength(3, [trips[0]] + [v for v in values if v != trips[0]][:2])  # Three of a kind
+    if len(pairs) >= 2:
+        kicker = [v for v in values if v not in pairs[:2]][:1]
+        return _pack_strength(2, pairs[:2] + kicker)  # Two pair
+    if pairs:
+        return _pack_strength(1, [pairs[0]] + [v for v in values if v != pairs[0]][:3])  # One pair
+    return _pack_strength(0, values[:5])  # High card
+
+
+def build_tables():
+    """Enumerate every flush mask and 7-rank multiset and return both tables as int arrays."""
+    flush_table = array('i', [_flush_strength(mask) for mask in range(FLUSH_TABLE_SIZE)])
+    rank_table = array('i', [0] * RANK_TABLE_SIZE)
+    for ranks in combinations_with_replacement(range(13), 7):
+        counts = [0] * 13
+        for r in ranks:
+            counts[r] += 1
+        if max(counts) > 4:
+            continue
+        index = sum(binomial(r + i, i + 1) for i, r in enumerate(ranks))
+        rank_table[index] = _rank_strength(counts)
+    return flush_table, rank_table
+
+
+def load_tables(path=DEFAULT_TABLE_PATH):
+    """Load the lookup tables from path, building and caching them there on first use."""
+    cdef int i, r
+    flush_table = rank_table = None
+    try:
+        with open(path, 'rb') as f:
+            if f.read(4) == TABLE_MAGIC:
+                flush_table, rank_table = array('i'), array('i')
+                flush_table.fromfile(f, FLUSH_TABLE_SIZE)
+                rank_table.fromfile(f, RANK_TABLE_SIZE)
+    except (OSError, EOFError):
+        flush_table = rank_table = None
+    if flush_table is None:
+        flush_table, rank_table = build_tables()
+        try:
+            with open(path, 'wb') as f:
+                f.write(TABLE_MAGIC)
+                flush_table.tofile(f)
+                rank_table.tofile(f)
+        except OSError:
+            pass  # read-only install, rebuild next time
+    for i in range(FLUSH_TABLE_SIZE):
+        FLUSH_TABLE[i] = flush_table[i]
+    for i in range(RANK_TABLE_SIZE):
+        RANK_TABLE[i] = rank_table[i]
+    for r in range(13):
+        for i in range(7):
+            MULTISET_OFFSET[r][i] = binomial(r + i, i + 1)
+
+load_tables()
+
+
+cdef inline int evaluate_cards(const int* cards) noexcept nogil:
+    """Strength of the best 5-card hand out of 7 card indices."""
+    cdef int suit_masks[4]
+    cdef int counts[13]
+    cdef int i, j, r, k = 0, index = 0
+    memset(suit_masks, 0, sizeof(suit_masks))
+    memset(counts, 0, sizeof(counts))
+    for i in range(7):
+        r = cards[i] >> 2
+        suit_masks[cards[i] & 3] |= 1 << r
+        counts[r] += 1
+    for i in range(4):
+        if FLUSH_TABLE[suit_masks[i]]:
+            return FLUSH_TABLE[suit_masks[i]]
+    for r in range(13):
+        for j in range(counts[r]):
+            index += MULTISET_OFFSET[r][k]
+            k += 1
+    return RANK_TABLE[index]
+
+
+def decode_hand_rank(int strength):
+    """Turn a hand strength back into the (rank_type, rank_values) tuple used by describe_hand."""
+    values = tuple(v for v in ((strength >> shift) & 0xF for shift in (16, 12, 8, 4, 0)) if v)
+    return (strength >> 20, values)
+
+
+cdef int load_cards(list player_hand, list community_cards, int* cards, int min_board) except -1:
+    """Copy 2 hole cards and min_board to 5 community cards into cards, returning the number of
+    community cards. Raises ValueError rather than write past cards or index the tables with a bad card."""
+    cdef int i, card, total_community_cards = len(community_cards)
+    if len(player_hand) != 2:
+        raise ValueError("player_hand must be 2 cards")
+    if not min_board <= total_community_cards <= 5:
+        raise ValueError("community_cards must be 5 cards" if min_board == 5 else "community_cards must be at most 5 cards")
+    for i in range(2 + total_community_cards):
+        card = player_hand[i] if i < 2 else community_cards[i - 2]
+        if not 0 <= card <= 51:
+            raise ValueError("cards must be encoded as 0-51")
+        cards[i] = card
+    return total_community_cards
+
+
+cpdef int evaluate_hand(list player_hand, list community_cards):
+    """Strength of the best hand made from 2 hole cards and 5 community cards."""
+    cdef int cards[7]
+    load_cards(player_hand, community_cards, cards, 5)
+    return evaluate_cards(cards)
+
+
+cpdef tuple get_best_hand(list player_hand, list community_cards):
+    """Compatibility wrapper around evaluate_hand, returns (rank_type, rank_values)
+    with rank values ordered by significance."""
+    return decode_hand_rank(evaluate_hand(player_hand, community_cards))
+
+
+def evaluate_hands(cards):
+    """Strengths of many hands in one call. cards is an (N, 7) int array of 2 hole cards
+    and 5 community cards per hand. Returns an int32 array of N strengths."""
+    cards = np.ascontiguousarray(cards, dtype=np.intc)
+    if cards.ndim != 2 or cards.shape[1] != 7:
+        raise ValueError("cards must be (N, 7)")
+    if cards.size and (cards.min() < 0 or cards.max() > 51):
+        raise ValueError("cards must be encoded as 0-51")
+    strengths = np.empty(cards.shape[0], dtype=np.intc)
+
+    cdef int[:, ::1] card_view = cards
+    cdef int[::1] strength_view = strengths
+    cdef Py_ssize_t i
+    for i in range(card_view.shape[0]):
+        strength_view[i] = evaluate_cards(&card_view[i, 0])
+    return strengths
+
+
+# --- Random number generation ---
+# xoshiro256** seeded through splitmix64. Each Simulator owns its state, so streams
+# never depend on the wall clock and a seed reproduces a run exactly.
+
+cdef struct RNG:
+    unsigned long long s[4]
+
+
+cdef inline unsigned long long rotl(unsigned long long x, int k) noexcept nogil:
+    return (x << k) | (x >> (64 - k))
+
+
+cdef void rng_seed(RNG* rng, unsigned long long seed) noexcept nogil:
+    cdef int i
+    cdef unsigned long long z
+    for i in range(4):
+        seed += 0x9E3779B97F4A7C15ULL
+        z = seed
+        z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+        z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+        rng.s[i] = z ^ (z >> 31)
+
+
+cdef inline unsigned long long rng_next(RNG* rng) noexcept nogil:
+    cdef unsigned long long result = rotl(rng.s[1] * 5, 7) * 9
+    cdef unsigned long long t = rng.s[1] << 17
+    rng.s[2] ^= rng.s[0]
+    rng.s[3] ^= rng.s[1]
+    rng.s[1] ^= rng.s[2]
+    rng.s[0] ^= rng.s[3]
+    rng.s[2] ^= t
+    rng.s[3] = rotl(rng.s[3], 45)
+    return result
+
+
+cdef inline unsigned int rng_below(RNG* rng, unsigned int n) noexcept nogil:
+    """Unbiased integer in [0, n), Lemire's multiply-and-reject."""
+    cdef unsigned long long m = (rng_next(rng) >> 32) * n
+    cdef unsigned int threshold
+    if <unsigned int>m < n:
+        threshold = (-n) % n
+        while <unsigned int>m < threshold:
+            m = (rng_next(rng) >> 32) * n
+    return <unsigned int>(m >> 32)
+
+
+# Spots with at most this many (runout, opponent hand) pairs are enumerated exactly instead of
+# sampled. The default covers the river (990) only: the turn (44 * 946) costs about a hundred
+# times a 100 sample simulation, and the game engines evaluate it on every decision.
+cdef long long default_exact_budget = 1000
+
+
+def set_exact_budget(long long budget):
+    """Change the enumeration budget used when none is passed, 0 always samples."""
+    global default_exact_budget
+    default_exact_budget = budget
+
+
+cdef long long count_combinations(int n, int k) noexcept nogil:
+    cdef long long result = 1
+    cdef int i
+    if k < 0 or k > n:
+        return 0
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+cdef void enumerate_outcomes(int* cards_us, int total_community_cards, int* remaining,
+                             int num_remaining, long long* counts) noexcept nogil:
+    """Exact win/tie/loss counts against one opponent over every runout and opponent hand."""
+    cdef int missing = 5 - total_community_cards
+    cdef int cards_opps[7]
+    cdef int idx[5]
+    cdef int dealt[52]
+    cdef int i, j, a, b, our_rank, opp_rank
+
+    memset(dealt, 0, sizeof(dealt))
+    for i in range(total_community_cards):
+        cards_opps[i + 2] = cards_us[i + 2]
+    for i in range(missing):
+        idx[i] = i
+
+    while True:
+        # Deal the runout given by idx
+        for i in range(missing):
+            cards_us[total_community_cards + 2 + i] = remaining[idx[i]]
+            cards_opps[total_community_cards + 2 + i] = remaining[idx[i]]
+            dealt[remaining[idx[i]]] = 1
+        our_rank = evaluate_cards(cards_us)
+
+        # Every opponent hand from the cards left
+        for a in range(num_remaining):
+            if dealt[remaining[a]]:
+                continue
+            cards_opps[0] = remaining[a]
+            for b in range(a + 1, num_remaining):
+                if dealt[remaining[b]]:
+                    continue
+                cards_opps[1] = remaining[b]
+                opp_rank = evaluate_cards(cards_opps)
+                if our_rank > opp_rank:
+                    counts[0] += 1
+                elif our_rank == opp_rank:
+                    counts[1] += 1
+                else:
+                    counts[2] += 1
+
+        for i in range(missing):
+            dealt[remaining[idx[i]]] = 0
+
+        # Advance to the next runout in lexicographic order
+        i = missing - 1
+        while i >= 0 and idx[i] == num_remaining - missing + i:
+            i -= 1
+        if i < 0:
+            break
+        idx[i] += 1
+        for j in range(i + 1, missing):
+            idx[j] = idx[j - 1] + 1
+
+
+cdef void simulate_outcomes(RNG* rng, int* cards_us, int total_community_cards, int* remaining,
+                            int num_remaining, int num_opponents, int num_simulations,
+                            long long* counts) noexcept nogil:
+    """Sampled win/tie/loss counts against num_opponents random hands sharing one deck."""
+    cdef int missing = 5 - total_community_cards
+    cdef int needed = missing + 2 * num_opponents
+    cdef int cards_opps[7]
+    cdef int i, j, tmp, opp, sim_index, our_rank, opp_rank, best_opp_rank
+
     for i in range(total_community_cards):
-        board[i][0] = community_cards[i][0].encode('utf-8')[0]
-        board[i][1] = community_cards[i][1].encode('utf-8')[0]
+        cards_opps[i + 2] = cards_us[i + 2]
 
-    # Simulation loop
     for sim_index in range(num_simulations):
-        memcpy(shuffled_deck, deck, sizeof(deck))
-        for i in range(52):
-            j = rand() % (52 - i) + i
-            shuffled_deck[i][0], shuffled_deck[j][0] = shuffled_deck[j][0], shuffled_deck[i][0]
-            shuffled_deck[i][1], shuffled_deck[j][1] = shuffled_deck[j][1], shuffled_deck[i][1]
-
-        # Deal cards not in use
-        k = 0
-        num_cards = total_community_cards  # Track filled community cards
-        for i in range(52):
-            found = 0
-            for j in range(2):
-                if shuffled_deck[i][0] == our_hand[j][0] and shuffled_deck[i][1] == our_hand[j][1]:
-                    found = 1
-                    break      
-            for j in range(num_cards):
-                if shuffled_deck[i][0] == board[j][0] and shuffled_deck[i][1] == board[j][1]:
-                    found = 1
-                    break
-            if not found:
-                if k < 2:
-                    opponent_hand[k][0] = shuffled_deck[i][0]
-                    opponent_hand[k][1] = shuffled_deck[i][1]
-                    k += 1
-                elif k < (7 - total_community_cards):
-                    board[num_cards][0] = shuffled_deck[i][0]
-                    board[num_cards][1] = shuffled_deck[i][1]
-                    num_cards += 1
-                    k += 1
-                if k == (7 - total_community_cards):
-                    break
-
-        # Initialize the combined cards array
-        for i in range(2):
-            combined_cards_us[i][0] = our_hand[i][0]
-            combined_cards_us[i][1] = our_hand[i][1]
-            combined_cards_opps[i][0] = opponent_hand[i][0]
-            combined_cards_opps[i][1] = opponent_hand[i][1]
-        for i in range(5):
-            combined_cards_us[i+2][0] = board[i][0]
-            combined_cards_us[i+2][1] = board[i][1]
-            combined_cards_opps[i+2][0] = board[i][0]
-            combined_cards_opps[i+2][1] = board[i][1]
-
-        # Initialize best rank and best hand
-        best_rank_us = (-1,())
-        best_rank_opps = (-1,())
-
-        # Evaluate the best hand for us
-        for combination in combinations(range(7), 5):
-            for j in range(5):
-                current_hand[j][0] = combined_cards_us[combination[j]][0]
-                current_hand[j][1] = combined_cards_us[combination[j]][1]
-            current_rank = single_hand_rank(current_hand)
-            if current_rank > best_rank_us:
-                best_rank_us = current_rank
-
-        # Evaluate the best hand for opponent
-        for combination in combinations(range(7), 5):
-            for j in range(5):
-                current_hand[j][0] = combined_cards_opps[combination[j]][0]
-                current_hand[j][1] = combined_cards_opps[combination[j]][1]
-            current_rank = single_hand_rank(current_hand)
-            if current_rank > best_rank_opps:
-                best_rank_opps = current_rank
-
-        # Debug: Print hands and ranks
-        # print("Player's best hand:", best_rank_us)
-        # print("Opp's best hand:", best_rank_opps)
-        
-        if best_rank_us >= best_rank_opps:
-            wins += 1
-
-    return wins / float(num_simulations)
-
-
-cdef void sort_array(int arr[], int n):
-    cdef int i, j, tmp
-    for i in range(n - 1):
-        for j in range(0, n - i - 1):
-            if arr[j] > arr[j + 1]:
-                tmp = arr[j]
-                arr[j] = arr[j + 1]
-                arr[j + 1] = tmp
-
-
-cdef tuple single_hand_rank(char hand[5][2]):
-    cdef int values[5]
-    cdef char suits[5]
-    cdef int i, straight, flush
-    cdef int val_count[15]  # 15 to include ranks from 2 to Ace
-
-    # Initialize val_count to 0
-    for i in range(15):
-        val_count[i] = 0
-
-    # Populate value and suit arrays
-    for i in range(5):
-        values[i] = card_value(hand[i][1])
-        suits[i] = hand[i][0]
-        val_count[values[i]] += 1
-
-    # Check for flush
-    flush = (suits[0] == suits[1] == suits[2] == suits[3] == suits[4])
-
-    # Check for straight
-    sort_array(values, 5)
-    straight = (values[0] + 1 == values[1] and values[1] + 1 == values[2] and
-                values[2] + 1 == values[3] and values[3] + 1 == values[4])
-
-    # Ace can also be high in a straight (10, J, Q, K, Ace)
-    if not straight:
-        if values == [10, 11, 12, 13, 14]:  # Check for Ace-high straight
-            straight = 1
-        elif values == [2, 3, 4, 5, 14]:  # Check for Ace-low straight
-            straight = 1
-            values = [1, 2, 3, 4, 5]  # Treat Ace as low for ranking purposes
-
-    # Determine hand rank
-    if straight and flush:
-        return (8, tuple(values))  # Straight flush
-    elif has_n_of_a_kind(val_count, 4):
-        four_kind = get_n_of_a_kind(val_count, 4)
-        kicker = max([v for v in values if v != four_kind])
-        return (7, (four_kind, kicker))  # Four of a kind
-    elif has_n_of_a_kind(val_count, 3) and has_n_of_a_kind(val_count, 2):
-        three_kind = get_n_of_a_kind(val_count, 3)
-        pair = get_n_of_a_kind(val_count, 2)
-        return (6, (three_kind, pair))  # Full house
-    elif flush:
-        return (5, tuple(values))  # Flush
-    elif straight:
-        return (4, tuple(values))  # Straight
-    elif has_n_of_a_kind(val_count, 3):
-        three_kind = get_n_of_a_kind(val_count, 3)
-        kicker = sorted([v for v in values if v != three_kind], reverse=True)
-        return (3, (three_kind,) + tuple(kicker))  # Three of a kind
-    elif count_pairs(val_count) >= 2:
-        pairs = get_pairs(val_count)
-        kicker = max([v for v in values if v not in pairs])
-        return (2, tuple(pairs) + (kicker,))  # Two pair
-    elif has_n_of_a_kind(val_count, 2):
-        pair = get_n_of_a_kind(val_count, 2)
-        kicker = sorted([v for v in values if v != pair], reverse=True)
-        return (1, (pair,) + tuple(kicker))  # One pair
+        # Partial Fisher-Yates: only the cards this trial deals get drawn
+        for i in range(needed):
+            j = i + rng_below(rng, num_remaining - i)
+            tmp = remaining[i]
+            remaining[i] = remaining[j]
+            remaining[j] = tmp
+
+        # Deal the rest of the board, then two cards per opponent
+        for i in range(missing):
+            cards_us[total_community_cards + 2 + i] = remaining[i]
+            cards_opps[total_community_cards + 2 + i] = remaining[i]
+        our_rank = evaluate_cards(cards_us)
+
+        best_opp_rank = 0
+        for opp in range(num_opponents):
+            cards_opps[0] = remaining[missing + 2 * opp]
+            cards_opps[1] = remaining[missing + 2 * opp + 1]
+            opp_rank = evaluate_cards(cards_opps)
+            if opp_rank > best_opp_rank:
+                best_opp_rank = opp_rank
+                if best_opp_rank > our_rank:
+                    break  # already lost, skip the other opponents
+
+        if our_rank > best_opp_rank:
+            counts[0] += 1
+        elif our_rank == best_opp_rank:
+            counts[1] += 1
+        else:
+            counts[2] += 1
+
+
+cdef int collect_remaining(const int* cards, int num_cards, int* remaining) noexcept nogil:
+    """Fill remaining with the cards not in cards, returns how many there are."""
+    cdef int used[52]
+    cdef int i, num_remaining = 0
+    memset(used, 0, sizeof(used))
+    for i in range(num_cards):
+        used[cards[i]] = 1
+    for i in range(52):
+        if not used[i]:
+            remaining[num_remaining] = i
+            num_remaining += 1
+    return num_remaining
+
+
+cdef bint within_exact_budget(int num_remaining, int total_community_cards, int num_opponents,
+                              long long exact_budget) noexcept nogil:
+    return num_opponents == 1 and (count_combinations(num_remaining, 5 - total_community_cards)
+            * count_combinations(num_remaining - 5 + total_community_cards, 2) <= exact_budget)
+
+
+cdef double spot_equity(const int* hand, const int* board, int num_opponents, int num_simulations,
+                        long long exact_budget, unsigned long long seed) noexcept nogil:
+    """Equity (win + tie / 2) of one batch_equity row, board padded with negative cards."""
+    cdef int cards_us[7]
+    cdef int remaining[52]
+    cdef long long counts[3]
+    cdef int i, num_remaining, total_community_cards = 0
+    cdef RNG rng
+
+    cards_us[0] = hand[0]
+    cards_us[1] = hand[1]
+    while total_community_cards < 5 and board[total_community_cards] >= 0:
+        cards_us[total_community_cards + 2] = board[total_community_cards]
+        total_community_cards += 1
+    num_remaining = collect_remaining(cards_us, total_community_cards + 2, remaining)
+
+    memset(counts, 0, sizeof(counts))
+    if within_exact_budget(num_remaining, total_community_cards, num_opponents, exact_budget):
+        enumerate_outcomes(cards_us, total_community_cards, remaining, num_remaining, counts)
     else:
-        return (0, tuple(values))  # High card
-
-        
-cdef int card_value(char rank):
-    """Convert card rank characters to numerical values for sorting and comparison."""
-    return {
-        b'2'[0]: 2, b'3'[0]: 3, b'4'[0]: 4, b'5'[0]: 5, b'6'[0]: 6,
-        b'7'[0]: 7, b'8'[0]: 8, b'9'[0]: 9, b'T'[0]: 10,
-        b'J'[0]: 11, b'Q'[0]: 12, b'K'[0]: 13, b'A'[0]: 14
-    }.get(rank, -1)
-
-
-cdef int has_n_of_a_kind(int[15] val_count, int n):
-    """Helper function to check if there is n of a kind."""
-    for i in range(15):
-        if val_count[i] == n:
-            return 1
-    return 0
-
-cdef int get_n_of_a_kind(int[15] val_count, int n):
-    """Helper function to get the rank of n of a kind."""
-    for i in range(15):
-        if val_count[i] == n:
-            return i
-    return -1  # Should never be reached
-
-cdef list get_pairs(int[15] val_count):
-    """Helper function to get all pairs."""
-    pairs = []
-    for i in range(15):
-        if val_count[i] == 2:
-            pairs.append(i)
-    return pairs
-
-cdef int count_pairs(int[15] val_count):
-    """Helper function to count the number of pairs."""
-    count = 0
-    for i in range(15):
-        if val_count[i] == 2:
-            count += 1
-    return count
\ No newline at end of file
+        rng_seed(&rng, seed)
+        simulate_outcomes(&rng, cards_us, total_community_cards, remaining, num_remaining,
+                          num_opponents, num_simulations, counts)
+    return (counts[0] + 0.5 * counts[1]) / <double>(counts[0] + counts[1] + counts[2])
+
+
+cdef void simulate_chunk(unsigned long long seed, const int* cards_us, int total_community_cards,
+                         const int* remaining, int num_remaining, int num_opponents, int num_simulations,
+                         long long* counts) noexcept nogil:
+    """One thread's share of the trials, on its own copy of the cards and its own RNG."""
+    cdef RNG rng
+    cdef int local_cards_us[7]
+    cdef int local_remaining[52]
+    rng_seed(&rng, seed)
+    memcpy(local_cards_us, cards_us, sizeof(local_cards_us))
+    memcpy(local_remaining, remaining, num_remaining * sizeof(int))
+    simulate_outcomes(&rng, local_cards_us, total_community_cards, local_remaining, num_remaining,
+                      num_opponents, num_simulations, counts)
+
+
+cdef class Simulator:
+    """Equity simulator with its own random stream, seeded from os.urandom unless given a seed."""
+    cdef RNG rng
+
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), 'little')
+        rng_seed(&self.rng, <unsigned long long>(seed & 0xFFFFFFFFFFFFFFFF))
+
+    cpdef tuple monte_carlo_simulation(self, list player_hand, list community_cards, int num_simulations=1000,
+                                       int num_opponents=1, long long exact_budget=-1, int num_threads=1):
+        """(win, tie, loss) fractions of player_hand against num_opponents random hands.
+        Heads up spots with at most exact_budget (runout, opponent hand) pairs are enumerated
+        exactly; -1 uses the module default from set_exact_budget. Sampled trials are split
+        into num_threads chunks run in parallel without the GIL, 0 uses every core."""
+        cdef int i, chunk, num_chunks, total_community_cards
+        cdef int num_remaining
+        cdef int remaining[52]
+        cdef int cards_us[7]
+        cdef long long counts[3]
+        cdef long long total
+        cdef long long* chunk_counts
+        cdef unsigned long long base_seed
+
+        if not 1 <= num_opponents <= (52 - 7) // 2:
+            raise ValueError(f"num_opponents must be between 1 and {(52 - 7) // 2}")
+
+        memset(counts, 0, sizeof(counts))
+        # Parse player and community cards into C array
+        total_community_cards = load_cards(player_hand, community_cards, cards_us, 0)
+        num_remaining = collect_remaining(cards_us, total_community_cards + 2, remaining)
+
+        if exact_budget < 0:
+            exact_budget = default_exact_budget
+        if within_exact_budget(num_remaining, total_community_cards, num_opponents, exact_budget):
+            # Small enough to enumerate exactly
+            enumerate_outcomes(cards_us, total_community_cards, remaining, num_remaining, counts)
+        else:
+            # Chunk c gets its own stream seeded from base_seed + c, so results only depend on
+            # the simulator seed and num_threads, not on how the threads get scheduled
+            num_chunks = max(1, min(num_threads if num_threads > 0 else os.cpu_count(), num_simulations))
+            base_seed = rng_next(&self.rng)
+            chunk_counts = <long long*>malloc(3 * num_chunks * sizeof(long long))
+            if chunk_counts == NULL:
+                raise MemoryError()
+            memset(chunk_counts, 0, 3 * num_chunks * sizeof(long long))
+            for chunk in prange(num_chunks, nogil=True, num_threads=num_chunks, schedule='static'):
+                simulate_chunk(base_seed + chunk, cards_us, total_community_cards, remaining, num_remaining,
+                               num_opponents, num_simulations // num_chunks + (chunk < num_simulations % num_chunks),
+                               chunk_counts + 3 * chunk)
+            for chunk in range(num_chunks):
+                for i in range(3):
+                    counts[i] += chunk_counts[3 * chunk + i]
+            free(chunk_counts)
+
+        total = counts[0] + counts[1] + counts[2]
+        return (counts[0] / <double>total, counts[1] / <double>total, counts[2] / <double>total)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def batch_equity(self, hands, boards, int num_simulations=100, num_opponents=1,
+                     long long exact_budget=-1, int num_threads=1):
+        """Equity (win + tie / 2) for every spot in one call. hands is an (N, 2) int array
+        of encoded cards, boards (N, 5) with unused slots set to -1, and num_opponents a
+        scalar or an array of N. Returns a float64 array of N equities."""
+        hands = np.ascontiguousarray(hands, dtype=np.intc)
+        boards = np.ascontiguousarray(boards, dtype=np.intc)
+        if hands.ndim != 2 or hands.shape[1] != 2 or boards.shape != (hands.shape[0], 5):
+            raise ValueError("hands must be (N, 2) and boards (N, 5)")
+        if hands.min(initial=0) < 0 or max(hands.max(initial=0), boards.max(initial=0)) > 51:
+            raise ValueError("cards must be encoded as 0-51, with -1 for unused board slots")
+        opponents = np.ascontiguousarray(np.broadcast_to(num_opponents, (hands.shape[0],)), dtype=np.intc)
+        if opponents.size and not (1 <= opponents.min() and opponents.max() <= (52 - 7) // 2):
+            raise ValueError(f"num_opponents must be between 1 and {(52 - 7) // 2}")
+        equities = np.empty(hands.shape[0], dtype=np.float64)
+
+        cdef int[:, ::1] hand_view = hands
+        cdef int[:, ::1] board_view = boards
+        cdef int[::1] opponent_view = opponents
+        cdef double[::1] equity_view = equities
+        cdef Py_ssize_t i, num_spots = hands.shape[0]
+        # Spot i samples from base_seed + i, whichever thread picks it up
+        cdef unsigned long long base_seed = rng_next(&self.rng)
+
+        if exact_budget < 0:
+            exact_budget = default_exact_budget
+        if num_threads <= 0:
+            num_threads = os.cpu_count()
+        for i in prange(num_spots, nogil=True, num_threads=num_threads, schedule='dynamic'):
+            equity_view[i] = spot_equity(&hand_view[i, 0], &board_view[i, 0], opponent_view[i],
+                                         num_simulations, exact_budget, base_seed + i)
+        return equities
+
+
+# shared by the module level helpers below
+cdef Simulator default_simulator = Simulator()
+
+
+def seed(seed=None):
+    """Reseed the default simulator, e.g. at the start of a reproducible training run."""
+    default_simulator.seed(seed)
+
+
+def monte_carlo_simulation(list player_hand, list community_cards, int num_simulations=1000,
+                           int num_opponents=1, long long exact_budget=-1, int num_threads=1):
+    """(win, tie, loss) fractions from the default simulator, see Simulator.monte_carlo_simulation."""
+    return default_simulator.monte_carlo_simulation(player_hand, community_cards, num_simulations,
+                                                    num_opponents, exact_budget, num_threads)
+
+
+def monte_carlo_batch(list player_hand, list community_cards, int num_simulations,
+                      int num_opponents=1, int num_threads=0):
+    """Large-sample (win, tie, loss) fractions, always sampled and spread over num_threads
+    cores (0 for all of them), e.g. for building preflop tables offline."""
+    return default_simulator.monte_carlo_simulation(player_hand, community_cards, num_simulations,
+                                                    num_opponents, 0, num_threads)
+
+
+def batch_equity(hands, boards, int num_simulations=100, num_opponents=1,
+                 long long exact_budget=-1, int num_threads=1):
+    """Equities of many spots from the default simulator, see Simulator.batch_equity."""
+    return default_simulator.batch_equity(hands, boards, num_simulations, num_opponents,
+                                          exact_budget, num_threads)
+
+
+# --- Suit isomorphism ---
+# Equity does not change when suits are relabelled or the board is reordered, so every
+# (hand, board) spot maps to the smallest packed key over all 24 suit permutations.
+
+cdef int SUIT_PERMUTATIONS[24][4]
+for _p, _perm in enumerate(permutations(range(4))):
+    for _s in range(4):
+        SUIT_PERMUTATIONS[_p][_s] = _perm[_s]
+
+
+cdef inline void sort_cards(int* cards, int n) noexcept nogil:
+    cdef int i, j, card
+    for i in range(1, n):
+        card = cards[i]
+        j = i - 1
+        while j >= 0 and cards[j] > card:
+            cards[j + 1] = cards[j]
+            j -= 1
+        cards[j + 1] = card
+
+
+cpdef unsigned long long canonical_key(list player_hand, list community_cards, int num_opponents=1):
+    """Key shared by every (hand, board) that is the same spot up to suit relabelling.
+    Hand and board are sorted and packed 6 bits per card, missing board cards as 63,
+    with num_opponents in the bits above."""
+    cdef int cards[7]
+    cdef int mapped[7]
+    cdef int total_community_cards = load_cards(player_hand, community_cards, cards, 0)
+    cdef int i, p
+    cdef unsigned long long key, best = 0xFFFFFFFFFFFFFFFF
+
+    for p in range(24):
+        for i in range(2 + total_community_cards):
+            mapped[i] = (cards[i] & ~3) | SUIT_PERMUTATIONS[p][cards[i] & 3]
+        for i in range(2 + total_community_cards, 7):
+            mapped[i] = 63
+        sort_cards(mapped, 2)
+        sort_cards(mapped + 2, total_community_cards)
+        key = 0
+        for i in range(7):
+            key = (key << 6) | mapped[i]
+        if key < best:
+            best = key
+    return best | (<unsigned long long>num_opponents << 42)
@@ -0,0 +1,152 @@
+import argparse
+import csv
+import io
+import os
+import time
+from utils import equity_cache
+
+# One row per player every SCORE_INTERVAL rounds (poker_game.py), appended and flushed as the
+# run goes so the file can be plotted while it grows. chip_delta is the chips the player won
+# at the table in the interval, rebuys aside; equity_eval_time the mean seconds one equity
+# took to simulate; the last three columns are empty for bots that do not learn.
+FIELDS = ['round', 'player', 'score', 'chips', 'chip_delta', 'hands_per_second',
+          'equity_eval_time', 'q_table_size', 'epsilon', 'alpha']
+
+class MetricsWriter:
+    """Streams a PokerGame's metrics to a CSV file once set as game.metrics. When resuming
+    from round resume_round, rows past it (played after the last checkpoint) are dropped and
+    new rows are appended to the rest."""
+    def __init__(self, path, resume_round=None):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if resume_round is not None and os.path.exists(path):
+            with open(path, newline='') as source, open(path + '.tmp', 'w', newline='') as target:
+                writer = csv.writer(target)
+                writer.writerow(FIELDS)
+                for row in csv.reader(source):
+                    # the header, and a row cut short by a crash, are left out too
+                    if len(row) == len(FIELDS) and row[0].isdigit() and int(row[0]) <= resume_round:
+                        writer.writerow(row)
+            os.replace(path + '.tmp', path)
+            self.file = open(path, 'a', newline='')
+            self.writer = csv.DictWriter(self.file, FIELDS)
+        else:
+            self.file = open(path, 'w', newline='')
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            self.writer.writeheader()
+            self.file.flush()
+        self.last_round = resume_round or 0
+        self.last_time = time.perf_counter()
+        self.last_chips_won = None
+        self.last_eval_time = equity_cache.eval_time
+        self.last_evaluations = equity_cache.evaluations
+
+    def write(self, game, round_number):
+        now = time.perf_counter()
+        hands_per_second = (round_number - self.last_round) / (now - self.last_time) if now > self.last_time else ''
+        evaluations = equity_cache.evaluations - self.last_evaluations
+        equity_eval_time = (equity_cache.eval_time - self.last_eval_time) / evaluations if evaluations else ''
+        last_chips_won = self.last_chips_won or [0] * len(game.players)
+        for player, chips_won, last_won in zip(game.players, game.chips_won, last_chips_won):
+            q_table = getattr(player, 'q_table', None)
+            self.writer.writerow({
+                'round': round_number,
+                'player': player.name,
+                'score': player.score,
+                'chips': player.chips,
+                'chip_delta': chips_won - last_won,
+                'hands_per_second': hands_per_second,
+                'equity_eval_time': equity_eval_time,
+                'q_table_size': len(q_table) if q_table is not None else '',
+                'epsilon': getattr(player, 'epsilon', ''),
+                'alpha': getattr(player, 'alpha', ''),
+            })
+        self.file.flush()
+        self.last_round = round_number
+        self.last_time = now
+        self.last_chips_won = list(game.chips_won)
+        self.last_eval_time = equity_cache.eval_time
+        self.last_evaluations = equity_cache.evaluations
+
+    def close(self):
+        self.file.close()
+
+class MetricsReader:
+    """Reads a metrics file incrementally: each read() returns the rows appended since the
+    previous one, as dicts of strings, leaving a line still being written for the next read."""
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.fields = None
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        complete = data[:data.rfind(b'\n') + 1]
+        self.offset += len(complete)
+        rows = list(csv.reader(io.StringIO(complete.decode())))
+        if self.fields is None and rows:
+            self.fields = rows.pop(0)
+        return [dict(zip(self.fields, row)) for row in rows]
+
+def plot_metrics(path, output=None, follow=False, refresh=5.0):
+    """Plot score, cumulative chips won and hands per second by round for every player. With
+    follow, keep the window open and add the rows a running training appends every refresh seconds."""
+    import matplotlib.pyplot as plt
+    reader = MetricsReader(path)
+    series = {} # player -> (rounds, scores, chips won so far)
+    speed = ([], []) # rounds, hands per second
+    fig, (score_axis, chips_axis, speed_axis) = plt.subplots(3, 1, figsize=(10, 10), sharex=True)
+    lines = {}
+    speed_line, = speed_axis.plot([], [], color='gray')
+
+    def update():
+        for row in reader.read():
+            rounds, scores, chips_won = series.setdefault(row['player'], ([], [], []))
+            rounds.append(int(row['round']))
+            scores.append(int(row['score']))
+            chips_won.append((chips_won[-1] if chips_won else 0) + int(row['chip_delta']))
+            if row['hands_per_second'] and (not speed[0] or speed[0][-1] != rounds[-1]):
+                speed[0].append(rounds[-1])
+                speed[1].append(float(row['hands_per_second']))
+        for player, (rounds, scores, chips_won) in series.items():
+            if player not in lines:
+                lines[player] = (score_axis.plot([], [], label=player)[0], chips_axis.plot([], [], label=player)[0])
+                score_axis.legend()
+                chips_axis.legend()
+            lines[player][0].set_data(rounds, scores)
+            lines[player][1].set_data(rounds, chips_won)
+        speed_line.set_data(*speed)
+        for axis in (score_axis, chips_axis, speed_axis):
+            axis.relim()
+            axis.autoscale_view()
+
+    score_axis.set_ylabel('Score')
+    score_axis.set_title('Player Score Tracker')
+    chips_axis.set_ylabel('Chips won')
+    speed_axis.set_ylabel('Hands per second')
+    speed_axis.set_xlabel('Round')
+    for axis in (score_axis, chips_axis, speed_axis):
+        axis.grid(True)
+    update()
+    fig.tight_layout()
+    if output:
+        fig.savefig(output)
+    if follow:
+        while plt.fignum_exists(fig.number):
+            plt.pause(refresh)
+            update()
+    else:
+        plt.show()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot a metrics file, optionally following a running training.')
+    parser.add_argument('path', nargs='?', default='./outputs/metrics.csv')
+    parser.add_argument('--follow', action='store_true', help='keep reading the rows the run appends')
+    parser.add_argument('--refresh', type=float, default=5.0, help='seconds between reads when following')
+    parser.add_argument('--output', default=None, help='also save the plot to this image')
+    args = parser.parse_args()
+    plot_metrics(args.path, args.output, args.follow, args.refresh)
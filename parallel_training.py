@@ -0,0 +1,96 @@
+import multiprocessing as mp
+import random
+import time
+import hand_rank_monte_carlo
+from poker_game import PokerGame
+from q_table import SharedQTable
+from utils import equity_cache
+from equity_cache import create_cache_file
+from game_log import OFF
+
+# Each worker plays its own table on a local copy of the Q-table and keeps the updates it
+# made since the last merge. Every merge_interval rounds all workers send those deltas, the
+# parent adds them to the shared table and sends back the new value of every key that changed,
+# so after each merge all tables are identical again. A SharedQTable needs no merging, every
+# worker updates it in place and the merge points only report progress.
+
+def run_worker(worker_id, seed, make_players, q_table, num_rounds, merge_interval, equity_cache_path,
+               start_round, total_rounds, conn):
+    random.seed(seed)
+    hand_rank_monte_carlo.seed(seed)
+    if equity_cache_path:
+        equity_cache.open_disk(equity_cache_path)
+
+    shared = isinstance(q_table, SharedQTable)
+    q_deltas = None if shared else {}
+    game = PokerGame(make_players(q_table, q_deltas))
+    game.verbose = False
+    game.log_level = OFF
+    played = 0
+    while played < num_rounds:
+        batch = min(merge_interval, num_rounds - played)
+        game.play_game(batch, start_round=start_round + played, total_rounds=total_rounds)
+        played += batch
+        if shared:
+            conn.send({})
+        else:
+            conn.send(q_deltas)
+            q_deltas.clear()
+        q_table.update(conn.recv())
+
+    conn.send((game.score_log, q_table.key_names if shared else {}))
+    conn.close()
+    equity_cache.close()
+
+def train_parallel(make_players, q_table, num_workers, rounds_per_worker, merge_interval=10000, seed=None,
+                   equity_cache_path=None, start_round=0, total_rounds=None, on_merge=None):
+    """Play num_workers independent tables of rounds_per_worker rounds each and merge their
+    Q-value updates into q_table every merge_interval rounds, or all update a SharedQTable
+    in place. make_players(q_table, q_deltas)
+    builds one table's players and must be a module level function. A resumed run passes the
+    rounds already played and the length of the whole run, and on_merge(rounds) is called
+    after every merge with the rounds each table has played. Returns the score logs
+    of every table, keyed by player name and worker."""
+    total_rounds = total_rounds or start_round + rounds_per_worker
+    base_seed = seed if seed is not None else random.randrange(2**32)
+    if equity_cache_path:
+        create_cache_file(equity_cache_path) # before the workers, so they all just map it
+    connections, workers = [], []
+    for worker_id in range(num_workers):
+        parent_conn, child_conn = mp.Pipe()
+        worker = mp.Process(target=run_worker, args=(worker_id, base_seed + worker_id, make_players, q_table,
+                                                     rounds_per_worker, merge_interval, equity_cache_path,
+                                                     start_round, total_rounds, child_conn))
+        worker.start()
+        child_conn.close()
+        connections.append(parent_conn)
+        workers.append(worker)
+
+    start_time = time.time()
+    num_merges = -(-rounds_per_worker // merge_interval)
+    for merge in range(num_merges):
+        changed = set()
+        for conn in connections:
+            for key, delta in conn.recv().items():
+                q_table[key] = q_table.get(key, 0) + delta
+                changed.add(key)
+        updates = {key: q_table[key] for key in changed}
+        for conn in connections:
+            conn.send(updates)
+        rounds = min((merge + 1) * merge_interval, rounds_per_worker)
+        elapsed_time = time.time() - start_time
+        print(f'Finished {start_round + rounds} rounds x {num_workers} tables, merged {len(changed)} Q-values, '
+              f'Q-table size: {len(q_table)}, time taken: {elapsed_time:2f} seconds')
+        if on_merge:
+            on_merge(start_round + rounds)
+
+    score_log = {}
+    for worker_id, conn in enumerate(connections):
+        worker_score_log, key_names = conn.recv()
+        for name, scores in worker_score_log.items():
+            score_log[f"{name}_{worker_id}"] = scores
+        if key_names:
+            q_table.key_names.update(key_names)
+    for worker in workers:
+        worker.join()
+    return score_log
@@ -1,4 +1,9 @@
 class Player:
+    __slots__ = ('name', 'score', 'chips', 'hand', 'current_bet', 'folded', 'playpot')
+
+    # whether get_action calls evaluate_hand_strength, so the game prefetches equities for it
+    evaluates_hand_strength = False
+
     def __init__(self, name, chips):
         self.name = name
         self.score = 0
@@ -16,7 +21,7 @@ class Player:
         self.current_bet += amount
 
     def reset_for_round(self):
-        self.hand = []
+        self.hand.clear()
         self.current_bet = 0
         self.folded = False
         self.playpot = 0
@@ -1,41 +1,87 @@
 from rl_bot import QLearningBot
-from utils import describe_hand, Deck, card_to_tuple
-from hand_rank_monte_carlo import get_best_hand
+from utils import describe_hand, Deck, equity_cache, prefetch_hand_strengths
+from hand_rank_monte_carlo import evaluate_hand, decode_hand_rank
+from state_encoding import EMPTY_HISTORY, STAGE_CODES, append_action, position_name
+from actions import FOLD, CHECK, CALL, RAISE_50, RAISE_100, ALL_IN, ACTION_NAMES, RAISE_PERCENTAGES
+from game_log import GameLog, DEBUG, INFO, WARNING
 import time
 import json
 
+BETTING_PHASES = {stage: f'betting/{stage}' for stage in STAGE_CODES}
+SCORE_INTERVAL = 100 # rounds between score log entries, learning rate updates and progress prints
+
 class PokerGame:
+    __slots__ = ('players', 'deck', 'community_cards', 'pots', 'starting_chips', 'pot', 'pot_index',
+                 'raise_amounts', 'current_bet', 'big_blind', 'small_blind', 'dealer_position', 'stage',
+                 'folded_mask', 'live_mask', 'actions', 'action_history', 'log_level', 'log', 'hand_history',
+                 'hand_actions', 'score_log', 'chips_won', 'metrics', 'profile', 'profile_log', 'equity_samples',
+                 'prefetch_equities', 'verbose')
+
     def __init__(self, players, big_blind=10, small_blind=5):
         self.players = players
         self.deck = Deck()
         self.community_cards = []
         self.pots = [0,0,0,0,0,0] # one main pot and five side pots maximum.
-        self.pot = 0
+        self.starting_chips = [0] * len(players) # chips of each seat before the blinds of this round
+        self.pot = 0 # sum of self.pots, kept up to date by add_to_pot
         self.pot_index = 0
+        self.raise_amounts = [0] * len(ACTION_NAMES) # chips each legal raise adds this turn, by action
         self.current_bet = 0
         self.big_blind = big_blind
         self.small_blind = small_blind
         self.dealer_position = 0
         self.stage = 'Pre-Flop'
-        self.actions = [] # keep track of action history of a round
-        self.log = [] # log messages
+        # seat i is bit 1 << i: seats that folded this round, and seats that can still act in
+        # this betting round (not folded, chips left); both kept up to date on every action
+        self.folded_mask = 0
+        self.live_mask = 0
+        self.actions = [] # keep track of action history of a round, as (position, action) pairs
+        self.action_history = EMPTY_HISTORY # the same history packed into an int, see state_encoding
+        # events at log_level and up go to self.log; per-round call sites check the level
+        # first, so a disabled event costs a single compare
+        self.log_level = DEBUG
+        self.log = GameLog()
+        self.hand_history = None # HandHistoryWriter recording every hand, see hand_history.py
+        self.hand_actions = [] # (stage, seat, action, chips put in) of this hand, while recording
         self.score_log = {player.name: [0] for player in players}
+        self.chips_won = [0] * len(players) # net chips each seat won over all its hands, rebuys aside
+        # MetricsWriter streaming a row per player every SCORE_INTERVAL rounds, see metrics.py;
+        # while set it replaces the in-memory score_log
+        self.metrics = None
+        # PhaseProfile timing every phase of a round, see profiling.py; None costs one check per phase
+        self.profile = None
+        self.profile_log = [] # profile summary of every SCORE_INTERVAL rounds, while profiling
+        self.equity_samples = 100 # Monte Carlo samples behind each bot's hand strength
+        # batch every bot's equity into one call per street; only pays off when most of
+        # them act on every street, e.g. full tables of QLearningBots
+        self.prefetch_equities = False
+        self.verbose = True # print progress every 100 rounds
 
-    def log_message(self, message):
-        self.log.append(message)
-        # print(message)
+    def log_message(self, level, template, *args):
+        """Log template.format(*args), formatted only when the log is written."""
+        if level >= self.log_level:
+            self.log.add(template, args)
 
     def write_log_to_file(self, filename='./outputs/game_log.txt'):
-        """Write the log messages to a text file."""
+        """Write the log messages to a text file, or finish the file they are streamed to."""
+        if self.log.sink is not None:
+            self.log.close()
+            return
         with open(filename, 'w') as f:
-            f.write('\n'.join(self.log))
-        self.log_message(f"Log written to {filename}")
+            f.write('\n'.join(self.log.lines()))
+        self.log_message(INFO, "Log written to {}", filename)
 
     def write_score_log_to_file(self, filename='./outputs/score_log.json'):
         """Write the score log to a JSON file."""
         with open(filename, 'w') as f:
             json.dump(self.score_log, f, indent=2)
-        self.log_message(f"Score log written to {filename}")
+        self.log_message(INFO, "Score log written to {}", filename)
+
+    def write_profile_log_to_file(self, filename='./outputs/profile_log.json'):
+        """Write the per-interval phase timings to a JSON file."""
+        with open(filename, 'w') as f:
+            json.dump(self.profile_log, f, indent=2)
+        self.log_message(INFO, "Profile log written to {}", filename)
 
     def rotate_dealer(self):
         self.dealer_position = (self.dealer_position + 1) % len(self.players)
@@ -43,28 +89,59 @@ class PokerGame:
     def deal_hands(self):
         self.deck.reset()
         for player in self.players:
-            player.hand = [self.deck.deal(), self.deck.deal()]
-        self.log_message(f"Dealt hands: {[f'{p.name}: {p.hand}' for p in self.players]}")
+            player.hand.append(self.deck.deal())
+            player.hand.append(self.deck.deal())
+        if self.log_level <= DEBUG:
+            self.log_message(DEBUG, "Dealt hands: {}", [f'{p.name}: {p.hand}' for p in self.players])
 
     def post_blinds(self):
         small_blind_position = (self.dealer_position + 1) % len(self.players)
         big_blind_position = (self.dealer_position + 2) % len(self.players)
         self.players[small_blind_position].place_bet(self.small_blind)
         self.players[big_blind_position].place_bet(self.big_blind)
-        self.pots[0] += self.small_blind + self.big_blind
+        self.add_to_pot(self.small_blind + self.big_blind)
         self.current_bet = self.big_blind
-        self.log_message(f"{self.players[small_blind_position].name} posts small blind of {self.small_blind}")
-        self.log_message(f"{self.players[big_blind_position].name} posts big blind of {self.big_blind}")
+        if self.log_level <= INFO:
+            self.log_message(INFO, "{} posts small blind of {}", self.players[small_blind_position].name, self.small_blind)
+            self.log_message(INFO, "{} posts big blind of {}", self.players[big_blind_position].name, self.big_blind)
     
-    def log_action(self, player_index, action):
-        position = self.get_player_position(player_index)
-        self.actions.append(position)
-        self.actions.append(action)
+    def log_action(self, player_index, action, amount):
+        position = (player_index - self.dealer_position) % len(self.players)
+        self.actions.append((position, action))
+        self.action_history = append_action(self.action_history, position, action)
+        if self.hand_history is not None:
+            self.hand_actions.append((STAGE_CODES[self.stage], player_index, action, amount))
         
     def get_player_position(self, player_index):
-        position = (player_index - self.dealer_position) % len(self.players)
-        position_names = ['btn', 'sb', 'bb', 'utg', 'mp', 'co']
-        return position_names[position] if position < len(position_names) else f'pos_{position}'
+        return position_name((player_index - self.dealer_position) % len(self.players))
+
+    def legal_actions(self, player, effective_stack):
+        """Bitmask of the actions player may take, see actions.py. Also sets raise_amounts
+        for the legal raises, which the betting round then applies."""
+        call_amount = self.current_bet - player.current_bet
+
+        if player.chips <= 0:
+            return 1 << CHECK
+
+        legal = 0
+        if player.current_bet < self.current_bet:
+            legal |= 1 << FOLD
+
+        if player.current_bet == self.current_bet:
+            legal |= 1 << CHECK
+        elif player.chips > 0:
+            legal |= 1 << CALL
+
+        if player.chips > self.current_bet:
+            # Pre-Flop only raises the pot, Post-Flop also half of it
+            for raise_action in (RAISE_50, RAISE_100) if self.community_cards else (RAISE_100,):
+                amount = (RAISE_PERCENTAGES[raise_action] / 100) * self.pot
+                if amount <= effective_stack - call_amount:
+                    legal |= 1 << raise_action
+                    self.raise_amounts[raise_action] = int(amount)
+            legal |= 1 << ALL_IN
+
+        return legal
 
     def betting_round(self):
         if self.stage == 'Pre-Flop':
@@ -74,6 +151,10 @@ class PokerGame:
 
         current_position = start_position
         active_players = [p for p in self.players if not p.folded and p.chips > 0]
+        self.live_mask = 0
+        for i, p in enumerate(self.players):
+            if not p.folded and p.chips > 0:
+                self.live_mask |= 1 << i
         all_in_action = False
         last_to_act = (start_position - 1) % len(self.players)
 
@@ -83,59 +164,74 @@ class PokerGame:
         
         while True:
             player = self.players[current_position]
-            if not player.folded and player.chips > 0:
+            if self.live_mask >> current_position & 1:
                 try:
                     max_opponent_stack = max(p.chips for p in active_players if p != player)
                 except ValueError:
                     max_opponent_stack = 0
                 effective_stack = min(player.chips, max_opponent_stack)
-                action = player.get_action(self, current_position, effective_stack)
+                legal = self.legal_actions(player, effective_stack)
+                if self.profile is None:
+                    action = player.get_action(self, current_position, effective_stack, legal)
+                else:
+                    start_time = time.perf_counter()
+                    action = player.get_action(self, current_position, effective_stack, legal)
+                    self.profile.add(f'get_action/{type(player).__name__}', time.perf_counter() - start_time)
+                chips_before = player.chips
                 if all_in_action:
-                    action = 'call' if 'fold' not in action else 'fold'
-                if action == 'fold':
+                    action = CALL if action != FOLD else FOLD
+                if action == FOLD:
                     player.folded = True
-                    self.log_message(f"{player.name} folds.")
-                elif action == 'call':
+                    self.folded_mask |= 1 << current_position
+                    if self.log_level <= INFO:
+                        self.log_message(INFO, "{} folds.", player.name)
+                elif action == CALL:
                     self.call_bet(player)
-                    self.log_message(f"{player.name} calls. Current bet: {player.current_bet}")
-                elif action == 'check':
-                    self.log_message(f"{player.name} checks. Current bet: {player.current_bet}")
-                elif action == 'all_in':
+                    if self.log_level <= INFO:
+                        self.log_message(INFO, "{} calls. Current bet: {}", player.name, player.current_bet)
+                elif action == CHECK:
+                    if self.log_level <= INFO:
+                        self.log_message(INFO, "{} checks. Current bet: {}", player.name, player.current_bet)
+                elif action == ALL_IN:
                     if not self.community_cards:
                         self.call_bet(player)
                         effective_stack = min(player.chips, max_opponent_stack)
                     self.raise_bet(player, effective_stack)
                     all_in_action = True
                     last_to_act = (current_position - 1) % len(self.players)
-                    self.log_message(f"{player.name} goes all-in for {effective_stack}")
-                elif action.startswith('raise_'):
-                    percentage = int(action.split('_')[1])
-                    amount = int((percentage / 100) * self.pot)
+                    if self.log_level <= INFO:
+                        self.log_message(INFO, "{} goes all-in for {}", player.name, effective_stack)
+                elif action in RAISE_PERCENTAGES:
+                    amount = self.raise_amounts[action]
                     self.call_bet(player)
                     self.raise_bet(player, amount)
                     last_to_act = (current_position - 1) % len(self.players)
-                    self.log_message(f"{player.name} raises {amount}. Current bet: {player.current_bet}")
+                    if self.log_level <= INFO:
+                        self.log_message(INFO, "{} raises {}. Current bet: {}", player.name, amount, player.current_bet)
                 else:
-                    self.log_message('Something went wrong, no action available.')
-                self.log_action(current_position, action)
+                    self.log_message(WARNING, 'Something went wrong, no action available.')
+                self.log_action(current_position, action, chips_before - player.chips)
+                if player.folded or player.chips == 0:
+                    self.live_mask &= ~(1 << current_position)
             
             if current_position == last_to_act:
                 if all(p.current_bet == self.current_bet or p.chips == 0 for p in active_players if not p.folded):
-                    if not (self.stage == 'Pre-Flop' and self.get_player_position(current_position) == 'sb' and self.actions.count('bb') < 1):
+                    if not (self.stage == 'Pre-Flop' and self.get_player_position(current_position) == 'sb'
+                            and all(position_name(position) != 'bb' for position, _ in self.actions)):
                         break
             
             current_position = (current_position + 1) % len(self.players)
             
-            # Check if no more action needed
-            live_players = [p for p in self.players if not p.folded and p.chips>0]
-            if len(live_players) <= 1:
+            # Check if no more action needed, at most one seat left to act
+            if self.live_mask & (self.live_mask - 1) == 0:
                 break
 
         for player in self.players:
             player.current_bet = 0
         
         self.current_bet = 0
-        self.actions = []
+        self.actions.clear()
+        self.action_history = EMPTY_HISTORY
 
         if all_in_action:
             self.pot_index += 1 # other players gets entitled to the next sidepot
@@ -149,32 +245,41 @@ class PokerGame:
             all_in_amount = player.chips
             player.place_bet(all_in_amount)
             actual_call_amount = player.current_bet
-            for p in self.players:
+            for i, p in enumerate(self.players):
                 if not p.folded and p != player:
                     if p.current_bet > actual_call_amount:
                         excess_amount = p.current_bet - actual_call_amount
-                        self.pots[self.pot_index] -= excess_amount
+                        self.add_to_pot(-excess_amount)
                         p.chips += excess_amount
+                        self.live_mask |= 1 << i
                         p.current_bet = actual_call_amount
             self.current_bet = actual_call_amount
-            self.pots[self.pot_index] += actual_call_amount
+            self.add_to_pot(actual_call_amount)
         else:
             call_amount = self.current_bet - player.current_bet
             player.place_bet(call_amount)
-            self.pots[self.pot_index] += call_amount
+            self.add_to_pot(call_amount)
             
     def raise_bet(self, player, amount):
         player.place_bet(amount)
         self.current_bet += amount
+        self.add_to_pot(amount)
+
+    def add_to_pot(self, amount):
         self.pots[self.pot_index] += amount
+        self.pot += amount
 
     def deal_flop(self):
-        self.community_cards = [self.deck.deal() for _ in range(3)]
-        self.log_message(f"Flop: {self.community_cards}, Main Pot Size: {self.pots[0]}")
+        for _ in range(3):
+            self.community_cards.append(self.deck.deal())
+        if self.log_level <= INFO:
+            self.log_message(INFO, "Flop: {}, Main Pot Size: {}", list(self.community_cards), self.pots[0])
 
     def deal_turn_or_river(self):
         self.community_cards.append(self.deck.deal())
-        self.log_message(f"{self.stage}: {self.community_cards[-1]} (Community cards: {self.community_cards}), Main Pot Size: {self.pots[0]}")
+        if self.log_level <= INFO:
+            self.log_message(INFO, "{}: {} (Community cards: {}), Main Pot Size: {}",
+                             self.stage, self.community_cards[-1], list(self.community_cards), self.pots[0])
 
     def determine_winner(self, starting_chips):
         for i in range(len(self.pots)):
@@ -184,15 +289,16 @@ class PokerGame:
             if len(entitled_players) == 1:
                 winner = entitled_players[0]
                 winner.chips += self.pots[i]
-                self.log_message(f"{winner.name} wins pot{i+1} of {self.pots[i]} chips.")
+                if self.log_level <= INFO:
+                    self.log_message(INFO, "{} wins pot{} of {} chips.", winner.name, i + 1, self.pots[i])
                 self.pots[i] = 0
                 continue
             best_hands = []
             for player in entitled_players:
-                best_hand = get_best_hand([card_to_tuple(card) for card in player.hand], [card_to_tuple(card) for card in self.community_cards])
+                best_hand = evaluate_hand(player.hand, self.community_cards)
                 best_hands.append((player, best_hand))
             if not best_hands: # safeguarding
-                self.log_message('Something went wrong, no winner.')
+                self.log_message(WARNING, 'Something went wrong, no winner.')
                 return
             best_hands.sort(key=lambda x: x[1], reverse=True)
             best_hand_rank = best_hands[0][1]
@@ -200,59 +306,119 @@ class PokerGame:
             split_pot = self.pots[i] // len(winners)
             for winner in winners:
                 winner.chips += split_pot
-                self.log_message(f"{winner.name} wins {split_pot} chips from pot {i + 1} with hand: {describe_hand(best_hand_rank)}")
+                if self.log_level <= INFO:
+                    self.log_message(INFO, "{} wins {} chips from pot {} with hand: {}",
+                                     winner.name, split_pot, i + 1, describe_hand(decode_hand_rank(best_hand_rank)))
             self.pots[i] = 0
             
-        for player in self.players:
+        for player, chips in zip(self.players, starting_chips):
             if isinstance(player, QLearningBot):
-                reward = player.chips - starting_chips[player.name]
+                reward = player.chips - chips
                 player.receive_reward(reward)
 
     def reset_for_new_round(self):
-        self.community_cards = []
-        self.pots = [0,0,0,0,0,0]
+        # cleared in place, nothing is allocated per round
+        self.community_cards.clear()
+        for i in range(len(self.pots)):
+            self.pots[i] = 0
+        self.pot = 0
         self.current_bet = 0
         self.pot_index = 0
-        self.actions = []
+        self.actions.clear()
+        self.action_history = EMPTY_HISTORY
+        self.hand_actions.clear()
+        self.folded_mask = 0
         for player in self.players:
             player.reset_for_round()
 
     def play_round(self):
-        starting_chips = {player.name: player.chips for player in self.players}
+        profile = self.profile
+        if profile is not None:
+            round_start = time.perf_counter()
+        starting_chips = self.starting_chips
+        for i, player in enumerate(self.players):
+            starting_chips[i] = player.chips
         self.reset_for_new_round()
+        if profile is not None:
+            start_time = time.perf_counter()
         self.deal_hands()
+        if profile is not None:
+            start_time = profile.lap('deal', start_time)
         self.post_blinds()
+        if profile is not None:
+            profile.lap('blinds', start_time)
+        all_seats = (1 << len(self.players)) - 1
         for stage in ['Pre-Flop', 'Flop', 'Turn', 'River']:
             self.stage = stage
-            active_players = [player for player in self.players if not player.folded]
-            if len(active_players) == 1:
+            in_hand = all_seats & ~self.folded_mask
+            if in_hand & (in_hand - 1) == 0: # one player left
                 break
+            if profile is not None:
+                start_time = time.perf_counter()
             if stage == 'Flop':
                 self.deal_flop()
             elif stage == 'Turn':
                 self.deal_turn_or_river()
             elif stage == 'River':
                 self.deal_turn_or_river()
-            self.log_message(f"Starting {stage} betting round.")
+            if profile is not None and stage != 'Pre-Flop':
+                start_time = profile.lap('deal', start_time)
+            if self.prefetch_equities:
+                prefetch_hand_strengths(self, self.equity_samples)
+                if profile is not None:
+                    start_time = profile.lap('prefetch', start_time)
+            if self.log_level <= INFO:
+                self.log_message(INFO, "Starting {} betting round.", stage)
             self.betting_round()
+            if profile is not None:
+                profile.lap(BETTING_PHASES[stage], start_time)
             
 
+        if self.hand_history is not None:
+            pots, payout_chips = list(self.pots), [player.chips for player in self.players]
+        if profile is not None:
+            start_time = time.perf_counter()
         self.determine_winner(starting_chips)
+        chips_won = self.chips_won
+        for i, player in enumerate(self.players):
+            chips_won[i] += player.chips - starting_chips[i]
+        if profile is not None:
+            start_time = profile.lap('determine_winner', start_time)
+        if self.hand_history is not None:
+            self.hand_history.record(self, starting_chips, pots, payout_chips)
+            if profile is not None:
+                start_time = profile.lap('hand_history', start_time)
         for player in self.players:
             player.check_rebuy(self)
+        if profile is not None:
+            profile.lap('rebuys', start_time)
         self.rotate_dealer()
-        self.log_message(f"End of round. Players' chips: {[player for player in self.players]}")
+        if self.log_level <= INFO:
+            self.log_message(INFO, "End of round. Players' chips: {}", str(self.players))
+        if profile is not None:
+            profile.lap('round', round_start)
+            profile.rounds += 1
 
-    def play_game(self, num_rounds):
+    def play_game(self, num_rounds, start_round=0, total_rounds=None):
+        """Play num_rounds rounds. A run split into several calls passes the rounds already
+        played and the length of the whole run so the learning schedules carry on."""
+        total_rounds = total_rounds or start_round + num_rounds
         start_time = time.time()
-        for i in range(num_rounds):
-            self.log_message(f"\n--- Round {i + 1} ---")
+        for i in range(start_round, start_round + num_rounds):
+            if self.log_level <= INFO:
+                self.log_message(INFO, "\n--- Round {} ---", i + 1)
             self.play_round()
-            if (i+1) % 100 == 0:
+            if (i+1) % SCORE_INTERVAL == 0:
                 for player in self.players:
                     if isinstance(player, QLearningBot):
-                        player.adjust_learning_rate(i + 1, num_rounds)
-                        player.adjust_exploration_rate(i + 1, num_rounds)
-                    self.score_log[player.name].append(player.score)
-                elapsed_time = time.time() - start_time
-                print(f'Finished {i+1} simulations, time taken: {elapsed_time:2f} seconds')
\ No newline at end of file
+                        player.adjust_learning_rate(i + 1, total_rounds)
+                        player.adjust_exploration_rate(i + 1, total_rounds)
+                    if self.metrics is None:
+                        self.score_log[player.name].append(player.score)
+                if self.metrics is not None:
+                    self.metrics.write(self, i + 1)
+                if self.profile is not None:
+                    self.profile_log.append(self.profile.take_interval(i + 1))
+                if self.verbose:
+                    elapsed_time = time.time() - start_time
+                    print(f'Finished {i+1} simulations, time taken: {elapsed_time:2f} seconds, {equity_cache}')
\ No newline at end of file
@@ -0,0 +1,94 @@
+import argparse
+import os
+import struct
+import time
+from array import array
+from hand_rank_monte_carlo import monte_carlo_batch, seed
+
+# A preflop hand is one of 169 classes, numbered high * 13 + low for a suited hand and
+# low * 13 + high for a pair or an offsuit hand, with ranks 0 (deuce) to 12 (ace).
+NUM_CLASSES = 169
+MAX_OPPONENTS = 5
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preflop_equity.bin')
+
+# file layout: header (magic, max opponents, classes, simulations per entry), then one float32
+# equity (win + tie / 2) per class for 1 opponent, then for 2 opponents, ... MAX_OPPONENTS
+HEADER = struct.Struct('<4sIII')
+MAGIC = b'PFE1'
+
+def hand_class(card1, card2):
+    high, low = card1 >> 2, card2 >> 2
+    if high < low:
+        high, low = low, high
+    return high * 13 + low if (card1 ^ card2) & 3 == 0 else low * 13 + high
+
+def class_hand(hand_id):
+    """Two cards of the class hand_id."""
+    first, second = divmod(hand_id, 13)
+    if first > second: # suited
+        return [first * 4, second * 4]
+    return [first * 4, second * 4 + 1]
+
+def class_combos(hand_id):
+    first, second = divmod(hand_id, 13)
+    return 6 if first == second else 4 if first > second else 12
+
+def class_name(hand_id):
+    first, second = divmod(hand_id, 13)
+    ranks = '23456789TJQKA'
+    if first > second:
+        return f"{ranks[first]}{ranks[second]}s"
+    return f"{ranks[second]}{ranks[first]}" + ('' if first == second else 'o')
+
+def build_table(num_simulations=500000, num_threads=0):
+    """Equities of every class against 1 to MAX_OPPONENTS random hands, as one flat array."""
+    equities = array('f')
+    for num_opponents in range(1, MAX_OPPONENTS + 1):
+        for hand_id in range(NUM_CLASSES):
+            win, tie, _ = monte_carlo_batch(class_hand(hand_id), [], num_simulations, num_opponents, num_threads)
+            equities.append(win + tie / 2)
+    return equities
+
+def save_table(equities, num_simulations, path=DEFAULT_TABLE_PATH):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, MAX_OPPONENTS, NUM_CLASSES, num_simulations))
+        equities.tofile(f)
+    os.replace(path + '.tmp', path)
+
+def load_table(path=DEFAULT_TABLE_PATH):
+    """Equities by opponents - 1 and class, as a list of MAX_OPPONENTS lists."""
+    with open(path, 'rb') as f:
+        magic, max_opponents, num_classes, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or max_opponents != MAX_OPPONENTS or num_classes != NUM_CLASSES:
+            raise ValueError(f"{path} is not a preflop equity table, rebuild it with python preflop_equity.py")
+        equities = array('f')
+        equities.fromfile(f, MAX_OPPONENTS * NUM_CLASSES)
+    return [equities[i * NUM_CLASSES:(i + 1) * NUM_CLASSES].tolist() for i in range(MAX_OPPONENTS)]
+
+def strength_table(equities):
+    """Hand strength (0 to 20) by opponents - 1 and class: the share of the 1326 starting hands
+    with at most the class's equity, so it ranks hands the way the hand-written map it replaces
+    did, 20 for the best hand and 10 for the median, whatever the number of opponents."""
+    strengths = []
+    for row in equities:
+        combos_at_most, combos = {}, 0
+        for hand_id in sorted(range(NUM_CLASSES), key=row.__getitem__):
+            combos += class_combos(hand_id)
+            combos_at_most[row[hand_id]] = combos
+        strengths.append([int(combos_at_most[equity] / 1326 * 20) for equity in row])
+    return strengths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the preflop equity table.')
+    parser.add_argument('--simulations', type=int, default=500000, help='simulations per class and opponent count')
+    parser.add_argument('--threads', type=int, default=0, help='cores to simulate on, 0 for all of them')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--path', default=DEFAULT_TABLE_PATH)
+    args = parser.parse_args()
+    seed(args.seed)
+    start_time = time.time()
+    equities = build_table(args.simulations, args.threads)
+    save_table(equities, args.simulations, args.path)
+    print(f"{NUM_CLASSES * MAX_OPPONENTS} equities in {time.time() - start_time:.1f}s, saved to {args.path}")
+    for hand_id in sorted(range(NUM_CLASSES), key=lambda hand_id: -equities[hand_id]):
+        print(class_name(hand_id), ' '.join(f"{equities[i * NUM_CLASSES + hand_id]:.3f}" for i in range(MAX_OPPONENTS)))
@@ -0,0 +1,49 @@
+import time
+from utils import equity_cache
+
+class PhaseProfile:
+    """Wall time and call count of each phase of PokerGame.play_round, once set as
+    game.profile. The phases are deal, blinds, prefetch, betting/<stage>, determine_winner,
+    hand_history and rebuys, plus bookkeeping for the rest of the round. get_action/<bot class>
+    is nested in the betting phases, and equity_simulation (the time utils.equity_cache spent
+    computing equities) in get_action and prefetch."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.rounds = 0
+        self.equity_time = equity_cache.eval_time
+        self.equity_evaluations = equity_cache.evaluations
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def lap(self, phase, start_time):
+        """Add the time since start_time to phase and return the current time."""
+        now = time.perf_counter()
+        self.add(phase, now - start_time)
+        return now
+
+    def take_interval(self, round_number):
+        """Per phase seconds, calls and mean seconds since the previous interval, which ends here."""
+        seconds, calls = self.seconds, self.calls
+        round_time = seconds.pop('round', 0.0)
+        calls.pop('round', None)
+        top_level = sum(time for phase, time in seconds.items() if not phase.startswith('get_action/'))
+        seconds['bookkeeping'] = round_time - top_level
+        calls['bookkeeping'] = self.rounds
+        seconds['equity_simulation'] = equity_cache.eval_time - self.equity_time
+        calls['equity_simulation'] = equity_cache.evaluations - self.equity_evaluations
+        interval = {
+            'round': round_number,
+            'rounds': self.rounds,
+            'seconds': round_time,
+            'phases': {phase: {'seconds': seconds[phase], 'calls': calls[phase],
+                               'mean': seconds[phase] / calls[phase] if calls[phase] else 0.0}
+                       for phase in sorted(seconds, key=seconds.get, reverse=True)},
+        }
+        self.reset()
+        return interval
@@ -0,0 +1,412 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from ast import literal_eval
+from multiprocessing import Lock, RawValue, resource_tracker, shared_memory
+import numpy as np
+from actions import ACTION_NAMES
+from state_encoding import encode_q_table
+
+def state_action_key(state, action):
+    """Stable 64-bit id of a (state, action) pair, the same in every process. Never 0."""
+    digest = hashlib.blake2b(repr((state, action)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+class ArrayQTable:
+    """Q-table keeping one row of action values per state in a NumPy array, so a bot scores
+    all its legal actions with one fancy-indexed read and applies a round's reward with one
+    np.add.at. Also a drop-in for the dict calls elsewhere (get, [], [] =, len, items), and
+    tracks the keys written since the last checkpoint like checkpoint.TrackedQTable."""
+    def __init__(self, q_table=None, capacity=1 << 12):
+        self.rows = {} # state -> row
+        self.values = np.zeros((capacity, len(ACTION_NAMES)))
+        self.known = np.zeros((capacity, len(ACTION_NAMES)), dtype=bool) # entries that have been set
+        self.dirty = set()
+        # state_action_key of each entry once a save has hashed it, 0 until then. Shared with copies,
+        # so what a snapshot hashes is not hashed again for the next one
+        self.state_keys = np.zeros((capacity, len(ACTION_NAMES)), dtype=np.uint64)
+        for (state, action), value in (q_table or {}).items():
+            row = self._row(state)
+            self.values[row, action] = value
+            self.known[row, action] = True
+
+    def _row(self, state):
+        row = self.rows.get(state)
+        if row is None:
+            row = self.rows[state] = len(self.rows)
+            if row == len(self.values):
+                self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+                self.known = np.concatenate([self.known, np.zeros_like(self.known)])
+                self.state_keys = np.concatenate([self.state_keys, np.zeros_like(self.state_keys)])
+        return row
+
+    def action_values(self, state, actions):
+        """Values of the given action codes in state, 0 for unseen ones."""
+        row = self.rows.get(state)
+        if row is None:
+            return np.zeros(len(actions))
+        return self.values[row].take(actions)
+
+    def states_values(self, states):
+        """Values of every action in each of states, one row per state, zeros for unseen ones."""
+        rows = np.fromiter([self.rows.get(state, -1) for state in states], np.intp, len(states))
+        values = self.values.take(np.maximum(rows, 0), axis=0)
+        values[rows < 0] = 0
+        return values
+
+    def add_reward(self, states_actions, delta):
+        """Add delta to the value of every (state, action) pair, repeated pairs once per repeat."""
+        if not states_actions:
+            return
+        width = len(ACTION_NAMES)
+        index = np.fromiter([self._row(state) * width + action for state, action in states_actions],
+                            np.intp, len(states_actions))
+        np.add.at(self.values.reshape(-1), index, delta)
+        self.known.reshape(-1)[index] = True
+        self.dirty.update(states_actions)
+
+    def get(self, state_action, default=None):
+        state, action = state_action
+        row = self.rows.get(state)
+        if row is None or not self.known[row, action]:
+            return default
+        return float(self.values[row, action])
+
+    def __getitem__(self, state_action):
+        value = self.get(state_action)
+        if value is None:
+            raise KeyError(state_action)
+        return value
+
+    def __contains__(self, state_action):
+        return self.get(state_action) is not None
+
+    def __setitem__(self, state_action, value):
+        state, action = state_action
+        row = self._row(state)
+        self.values[row, action] = value
+        self.known[row, action] = True
+        self.dirty.add(state_action)
+
+    def update(self, other):
+        for state_action, value in other.items():
+            self[state_action] = value
+
+    def __len__(self):
+        return int(np.count_nonzero(self.known))
+
+    def __iter__(self):
+        for state_action, _ in self.items():
+            yield state_action
+
+    def items(self):
+        for state, row in self.rows.items():
+            for action in np.flatnonzero(self.known[row]):
+                yield (state, int(action)), float(self.values[row, action])
+
+    def take_dirty(self):
+        """Changed entries since the last call, as a list of (state, action, value)."""
+        entries = [(state, action, self[(state, action)]) for state, action in self.dirty]
+        self.dirty = set()
+        return entries
+
+    def copy(self):
+        """Snapshot of the table that later updates leave alone, copying the arrays and the row
+        map rather than building a dict, so it is cheap enough to take on the training thread."""
+        table = ArrayQTable.__new__(ArrayQTable)
+        table.rows = self.rows.copy()
+        table.values = self.values.copy()
+        table.known = self.known.copy()
+        table.dirty = set()
+        table.state_keys = self.state_keys
+        return table
+
+    def entry_keys(self, rows, actions):
+        """state_action_key of the entries at rows, actions, hashing only those no save has yet."""
+        keys = self.state_keys[rows, actions]
+        missing = np.flatnonzero(keys == 0)
+        if len(missing):
+            states = list(self.rows) # in row order
+            keys[missing] = np.fromiter([state_action_key(states[row], action) for row, action
+                                         in zip(rows[missing].tolist(), actions[missing].tolist())],
+                                        np.uint64, len(missing))
+            self.state_keys[rows[missing], actions[missing]] = keys[missing]
+        return keys
+
+# shared memory layout: open-addressing slots of (key, value), key 0 marks an empty slot
+SLOT = struct.Struct('<Qd')
+MAX_PROBES = 64
+
+class SharedQTable:
+    """Q-table in a multiprocessing.shared_memory block that worker processes update in place.
+    Drop-in for the dict calls in rl_bot.py (get, [], [] =, len). Claiming a slot for a new
+    key takes a single insert lock, updating an existing key one of num_stripes locks picked
+    by its slot, and reads take none. The (state, action) behind each
+    hashed key is only known to the process that wrote it, see key_names."""
+    def __init__(self, capacity=1 << 22, num_stripes=64, name=None):
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=capacity * SLOT.size) # zero filled
+        self.locks = [Lock() for _ in range(num_stripes)]
+        self.insert_lock = Lock()
+        self.size = RawValue('q', 0) # guarded by insert_lock
+        self.key_names = {} # hashed key -> (state, action), for keys written by this process
+        self.owner = True
+
+    def __getstate__(self):
+        # only picklable when handed to a new process, which attaches to the same block
+        return {'name': self.shm.name, 'capacity': self.capacity, 'locks': self.locks,
+                'insert_lock': self.insert_lock, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self.locks = state['locks']
+        self.insert_lock = state['insert_lock']
+        self.size = state['size']
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        # the creating process owns the block, keep this one's resource tracker from unlinking it
+        resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.key_names = {}
+        self.owner = False
+
+    def _find(self, key):
+        """Offset of key's slot, or of the empty slot where it would go."""
+        buf = self.shm.buf
+        index = (key * 0x9E3779B97F4A7C15 >> 20) & (self.capacity - 1)
+        for probe in range(MAX_PROBES):
+            offset = ((index + probe) & (self.capacity - 1)) * SLOT.size
+            slot_key = SLOT.unpack_from(buf, offset)[0]
+            if slot_key == key or slot_key == 0:
+                return offset, slot_key
+        raise RuntimeError("SharedQTable is full, create it with a larger capacity")
+
+    def get(self, state_action, default=None):
+        offset, slot_key = self._find(state_action_key(*state_action))
+        return SLOT.unpack_from(self.shm.buf, offset)[1] if slot_key else default
+
+    def __getitem__(self, state_action):
+        value = self.get(state_action)
+        if value is None:
+            raise KeyError(state_action)
+        return value
+
+    def __contains__(self, state_action):
+        return self.get(state_action) is not None
+
+    def _write(self, state_action, value, add):
+        key = state_action_key(*state_action)
+        self.key_names[key] = state_action
+        offset, slot_key = self._find(key)
+        if not slot_key:
+            with self.insert_lock:
+                # probe again, another process may have claimed the slot meanwhile
+                offset, slot_key = self._find(key)
+                if not slot_key:
+                    # value before key, so a reader never sees the key without its value
+                    struct.pack_into('<d', self.shm.buf, offset + 8, value)
+                    struct.pack_into('<Q', self.shm.buf, offset, key)
+                    self.size.value += 1
+                    return value
+        with self.locks[(offset // SLOT.size) % len(self.locks)]:
+            if add:
+                value += SLOT.unpack_from(self.shm.buf, offset)[1]
+            struct.pack_into('<d', self.shm.buf, offset + 8, value)
+        return value
+
+    def __setitem__(self, state_action, value):
+        self._write(state_action, value, add=False)
+
+    def add(self, state_action, delta):
+        """Atomic read-modify-write, returns the new value."""
+        return self._write(state_action, delta, add=True)
+
+    def update(self, other):
+        for state_action, value in other.items():
+            self[state_action] = value
+
+    def __len__(self):
+        return self.size.value
+
+    def items(self):
+        """(state, action), value pairs for every key whose name this process knows."""
+        for key, state_action in self.key_names.items():
+            offset, slot_key = self._find(key)
+            if slot_key:
+                yield state_action, SLOT.unpack_from(self.shm.buf, offset)[1]
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+# --- Binary persistence ---
+# q_table.bin: 40 byte header, then open-addressing slots of (key, value) like SharedQTable,
+# values float64 so saving and loading never rounds them (version 1 files, still readable,
+# had float32). q_table.bin.states: the interned state dictionary, one JSON line
+# [state, [action, ...]] per state, tuples stored as lists. Lookups only need the .bin file,
+# the states file is for listing and converting.
+FILE_HEADER = struct.Struct('<4sIQQQQ') # magic, version, capacity, count, checkpoint sequence, round
+FILE_SLOTS = {1: struct.Struct('<Qf'), 2: struct.Struct('<Qd')} # by version
+FILE_VERSION = 2
+FILE_SLOT = FILE_SLOTS[FILE_VERSION]
+FILE_SLOT_DTYPE = np.dtype([('key', '<u8'), ('value', '<f8')]) # FILE_SLOT as a NumPy record
+FILE_MAGIC = b'QTB1'
+
+def states_path(path):
+    return path + '.states'
+
+def as_tuple(value):
+    return tuple(as_tuple(v) for v in value) if isinstance(value, list) else value
+
+def read_states(path):
+    """Yield (state, action) for every key listed in the state dictionary of path."""
+    with open(states_path(path)) as f:
+        for line in f:
+            state, actions = json.loads(line)
+            state = as_tuple(state)
+            for action in actions:
+                yield state, as_tuple(action)
+
+def file_slots(keys, values):
+    """(capacity, slots) of the binary format for arrays of keys and values, placed with the
+    linear probing MappedQTable.get_key follows but in a few NumPy passes instead of a loop."""
+    capacity = 1
+    while capacity < 2 * len(keys):
+        capacity *= 2
+    home = (keys * np.uint64(0x9E3779B97F4A7C15) >> np.uint64(20)) & np.uint64(capacity - 1)
+    order = np.argsort(home, kind='stable')
+    # in home order every key takes the first slot at or after its home that the keys before
+    # it left free: slot i = i + running max of (home - i)
+    index = np.arange(len(keys))
+    slot = index + np.maximum.accumulate(home[order].astype(np.int64) - index)
+    # keys pushed past the last slot wrap around to the first free slots from the start
+    wrapped = slot >= capacity
+    if wrapped.any():
+        slot[wrapped] = np.setdiff1d(np.arange(capacity), slot[~wrapped])[:np.count_nonzero(wrapped)]
+    slots = np.zeros(capacity, FILE_SLOT_DTYPE)
+    slots['key'][slot] = keys[order]
+    slots['value'][slot] = values[order]
+    return capacity, slots
+
+# JSON action list of each bitmask of action codes, for the states file lines of an ArrayQTable row
+MASK_ACTION_LISTS = np.array([json.dumps([action for action in range(len(ACTION_NAMES)) if mask >> action & 1])
+                              for mask in range(1 << len(ACTION_NAMES))], dtype=object)
+
+def save_q_table(q_table, path, sequence=0, round_number=0):
+    """Write any mapping of (state, action) -> value in the binary format. Both files are
+    written under temporary names and renamed into place, states first, so a crash never
+    leaves a half written table. sequence and round_number record which checkpoint it is.
+    An ArrayQTable is written straight from its arrays, see ArrayQTable.entry_keys."""
+    if isinstance(q_table, ArrayQTable):
+        row_states = list(q_table.rows)
+        known = q_table.known[:len(row_states)]
+        rows, actions = np.nonzero(known)
+        keys = q_table.entry_keys(rows, actions)
+        values = q_table.values[rows, actions]
+        masks = known @ (1 << np.arange(len(ACTION_NAMES)))
+        present = np.flatnonzero(masks)
+        states = [row_states[row] for row in present.tolist()]
+        action_lists = MASK_ACTION_LISTS[masks[present]].tolist()
+    else:
+        actions_by_state = {}
+        for (state, action), value in q_table.items():
+            actions_by_state.setdefault(state, []).append((action, value))
+        states = list(actions_by_state)
+        action_lists = [[action for action, _ in actions] for actions in actions_by_state.values()]
+        # a list of int action codes prints as its own JSON, so most lines skip the encoder
+        encode = str if all(type(action) is int for actions in action_lists for action in actions) else json.dumps
+        action_lists = list(map(encode, action_lists))
+        keys = np.fromiter([state_action_key(state, action) for state, actions in actions_by_state.items()
+                            for action, _ in actions], np.uint64)
+        values = np.fromiter([value for actions in actions_by_state.values() for _, value in actions], np.float64)
+    capacity, slots = file_slots(keys, values)
+
+    # a packed int state prints as its own JSON too
+    encode_state = str if all(type(state) is int for state in states) else json.dumps
+    with open(states_path(path) + '.tmp', 'w') as f:
+        f.writelines([f"[{encode_state(state)}, {action_list}]\n" for state, action_list in zip(states, action_lists)])
+    with open(path + '.tmp', 'wb') as f:
+        f.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, capacity, len(keys), sequence, round_number))
+        slots.tofile(f)
+    os.replace(states_path(path) + '.tmp', states_path(path))
+    os.replace(path + '.tmp', path)
+
+class MappedQTable:
+    """Read-only Q-table served straight from a memory-mapped q_table.bin, so opening it costs
+    nothing however many entries it has. Drop-in for the lookups in rl_bot.py."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.capacity, self.count, self.sequence, self.round_number = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != FILE_MAGIC or version not in FILE_SLOTS:
+            self.mm.close()
+            raise ValueError(f"{path} is not a binary Q-table")
+        self.slot = FILE_SLOTS[version]
+
+    def get_key(self, key, default=None):
+        index = (key * 0x9E3779B97F4A7C15 >> 20) & (self.capacity - 1)
+        while True:
+            slot_key, value = self.slot.unpack_from(self.mm, FILE_HEADER.size + index * self.slot.size)
+            if slot_key == key:
+                return value
+            if slot_key == 0:
+                return default
+            index = (index + 1) & (self.capacity - 1)
+
+    def get(self, state_action, default=None):
+        return self.get_key(state_action_key(*state_action), default)
+
+    def __getitem__(self, state_action):
+        value = self.get(state_action)
+        if value is None:
+            raise KeyError(state_action)
+        return value
+
+    def __contains__(self, state_action):
+        return self.get(state_action) is not None
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        for state_action in read_states(self.path):
+            value = self.get(state_action)
+            if value is not None: # listed by a newer states file than this table
+                yield state_action, value
+
+    def close(self):
+        self.mm.close()
+
+def load_q_table(path):
+    """Read a binary Q-table fully into a dict, for training runs that keep updating it."""
+    table = MappedQTable(path)
+    q_table = dict(table.items())
+    table.close()
+    return q_table
+
+def load_json_q_table(path):
+    """Read the old outputs/q_table.json, parsing keys as literals instead of eval() and
+    packing tuple states into ints."""
+    with open(path) as f:
+        return encode_q_table({literal_eval(k): v for k, v in json.load(f).items()})
+
+def save_json_q_table(q_table, path):
+    with open(path, 'w') as f:
+        json.dump({str(k): v for k, v in q_table.items()}, f, indent=2)
+
+if __name__ == '__main__':
+    # python q_table.py to-binary ./outputs/q_table.json ./outputs/q_table.bin
+    # python q_table.py to-json ./outputs/q_table.bin ./outputs/q_table.json
+    command, source, target = sys.argv[1:4]
+    if command == 'to-binary':
+        save_q_table(load_json_q_table(source), target)
+    elif command == 'to-json':
+        save_json_q_table(load_q_table(source), target)
+    else:
+        sys.exit(f"unknown command {command}, use to-binary or to-json")
+    print(f"{source} converted to {target}")
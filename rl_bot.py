@@ -1,13 +1,22 @@
 import random
 from utils import evaluate_hand_strength 
 from player import Player
+from q_table import ArrayQTable
+from actions import ACTION_NAMES, MASK_ACTIONS
+from game_log import DEBUG, INFO
+from state_encoding import STAGE_CODES, encode_state, state_hand_strength
 import json
 
 class QLearningBot(Player):
-    def __init__(self, name, chips, discount_factor=1, initial_learning_rate=0.1, final_learning_rate=0.5, initial_exploration_rate=0.5, final_exploration_rate=0.1, shared_q_table = {}):
+    __slots__ = ('initial_chips', 'q_table', 'q_deltas', 'gamma', 'initial_alpha', 'final_alpha',
+                 'initial_epsilon', 'final_epsilon', 'alpha', 'epsilon', 'states_actions')
+    evaluates_hand_strength = True
+
+    def __init__(self, name, chips, discount_factor=1, initial_learning_rate=0.1, final_learning_rate=0.5, initial_exploration_rate=0.5, final_exploration_rate=0.1, shared_q_table = {}, shared_q_deltas = None):
         super().__init__(name, chips)
         self.initial_chips = chips
         self.q_table = shared_q_table  # State-action value table
+        self.q_deltas = shared_q_deltas  # if given, accumulates updates since the last merge (parallel training)
         
         self.gamma = discount_factor
         self.initial_alpha = initial_learning_rate
@@ -19,87 +28,56 @@ class QLearningBot(Player):
         self.states_actions = []
 
     def get_state(self, game, current_position):
-        """ Convert the game state to a tuple that can be used as a dictionary key. """
-        position = game.get_player_position(current_position)
+        """ Pack the game state into an int that can be used as a dictionary key, see state_encoding. """
+        position = (current_position - game.dealer_position) % len(game.players)
+        stage = STAGE_CODES[game.stage]
         hand_strength = 0
         for pair in self.states_actions:
-            if pair[0][0] == game.stage:
-                hand_strength = pair[0][2]
+            if pair[0] & 3 == stage:
+                hand_strength = state_hand_strength(pair[0])
         if hand_strength == 0:
-            hand_strength = evaluate_hand_strength(game,self,100)
-        past_actions = game.actions
-        return (
-            game.stage,
-            position,
-            hand_strength,
-            tuple(past_actions),
-        )
+            hand_strength = evaluate_hand_strength(game,self,game.equity_samples)
+        return encode_state(game.stage, position, hand_strength, game.action_history)
         
     def choose_action(self, state, legal_actions, game):
         """ Choose an action based on the Q-Table, with exploration. """
         if random.random() < self.epsilon:
             return random.choice(legal_actions)  # Explore
         else:
-            q_values = [self.q_table.get((state, action), 0) for action in legal_actions]
-            game.log_message(f'hand_strength: {state[2]}')
-            game.log_message(f'legal_actions: {legal_actions}')
-            game.log_message(f'q_values:{q_values}')
-            max_q = max(q_values)
-            return legal_actions[q_values.index(max_q)]  # Exploit
-    
-    def is_valid_raise(self, raise_action, pot, effective_stack, call_amount):
-        percentage = int(raise_action.split('_')[1])
-        amount = (percentage / 100) * pot
-        return amount <= (effective_stack - call_amount)
-
-    def get_legal_actions(self, game, effective_stack):
-        legal_actions = []
-        game.pot = sum(game.pots)
-        call_amount = game.current_bet - self.current_bet
-
-        if self.chips <= 0:
-            return ['check']
-        
-        if self.current_bet < game.current_bet:
-            legal_actions.append('fold')
-        
-        if self.current_bet == game.current_bet:
-            legal_actions.append('check')
-        else:
-            if self.chips > 0:
-                legal_actions.append('call')
-        
-        if self.chips > game.current_bet:
-            if game.community_cards:
-                # Post-Flop
-                pot_fraction_raises = ['raise_50','raise_100']
+            if isinstance(self.q_table, ArrayQTable):
+                values = self.q_table.action_values(state, legal_actions)
+                best = int(values.argmax())
+                q_values = values.tolist()
             else:
-                # Pre-Flop
-                pot_fraction_raises = ['raise_100']
-
-            # Calculate the actual raise amounts and filter out invalid ones
-            valid_raises = [
-                raise_action for raise_action in pot_fraction_raises
-                if self.is_valid_raise(raise_action, game.pot, effective_stack, call_amount)
-            ]
-
-            legal_actions.extend(valid_raises)
-            legal_actions.append('all_in')
-
-        return legal_actions
-
-    def get_action(self, game, current_position, effective_stack):
+                q_values = [self.q_table.get((state, action), 0) for action in legal_actions]
+                best = q_values.index(max(q_values))
+            if game.log_level <= DEBUG:
+                game.log_message(DEBUG, 'hand_strength: {}', state_hand_strength(state))
+                game.log_message(DEBUG, 'legal_actions: {}', [ACTION_NAMES[action] for action in legal_actions])
+                game.log_message(DEBUG, 'q_values:{}', q_values)
+            return legal_actions[best]  # Exploit
+    
+    def get_action(self, game, current_position, effective_stack, legal_mask):
         state = self.get_state(game, current_position)
-        legal_actions = self.get_legal_actions(game, effective_stack)
-        action = self.choose_action(state, legal_actions, game)
+        action = self.choose_action(state, MASK_ACTIONS[legal_mask], game)
         self.states_actions.append((state,action))
         return action
 
     def receive_reward(self, reward):
-        for state, action in self.states_actions:
-            old_q_value = self.q_table.get((state, action), 0)
-            new_q_value = old_q_value + self.alpha * reward
-            self.q_table[(state, action)] = new_q_value
+        if isinstance(self.q_table, ArrayQTable):
+            self.q_table.add_reward(self.states_actions, self.alpha * reward)
+        elif hasattr(self.q_table, 'add'):
+            # SharedQTable: an atomic add, so learners in other processes do not lose updates
+            for state, action in self.states_actions:
+                self.q_table.add((state, action), self.alpha * reward)
+        else:
+            for state, action in self.states_actions:
+                old_q_value = self.q_table.get((state, action), 0)
+                new_q_value = old_q_value + self.alpha * reward
+                self.q_table[(state, action)] = new_q_value
+        if self.q_deltas is not None:
+            for state, action in self.states_actions:
+                self.q_deltas[(state, action)] = self.q_deltas.get((state, action), 0) + self.alpha * reward
         self.states_actions = []
 
     def check_rebuy(self,game):
@@ -110,7 +88,7 @@ class QLearningBot(Player):
                 deep_player.chips = self.initial_chips
                 deep_player.score += 2
                 
-            game.log_message(f"{self.name} rebuys for {self.initial_chips} chips.")
+            game.log_message(INFO, "{} rebuys for {} chips.", self.name, self.initial_chips)
             self.chips = self.initial_chips
             self.score -= 1
             
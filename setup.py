@@ -1,8 +1,15 @@
 #set up cpy
 #python3 setup.py build_ext --inplace
-from setuptools import setup
+import sys
+from setuptools import setup, Extension
 from Cython.Build import cythonize
 
+# OpenMP for the prange loops. Apple clang ships without it, so macOS builds run them on one core.
+openmp_flags = [] if sys.platform == 'darwin' else ['-fopenmp']
+
 setup(
-    ext_modules=cythonize("hand_rank_monte_carlo.pyx", compiler_directives={'language_level': "3"}),
-)
\ No newline at end of file
+    ext_modules=cythonize(
+        Extension("hand_rank_monte_carlo", ["hand_rank_monte_carlo.pyx"],
+                  extra_compile_args=openmp_flags, extra_link_args=openmp_flags),
+        compiler_directives={'language_level': "3"}),
+)
@@ -1,30 +1,106 @@
 from rl_bot import QLearningBot
 from honest_bot import HonestBot
 from random_bot import RandomBot
-from poker_game import PokerGame
+from poker_game import PokerGame, SCORE_INTERVAL
+from parallel_training import train_parallel
+from q_table import ArrayQTable, SharedQTable, load_json_q_table
+from checkpoint import QTableCheckpointer, TrackedQTable, resume_q_table, write_snapshot
+from utils import equity_cache
+from game_log import INFO, LEVELS
+from hand_history import HandHistoryWriter
+from profiling import PhaseProfile
+from metrics import MetricsWriter, plot_metrics
+import hand_rank_monte_carlo
+import argparse
 import json
+import os
+import random
 import matplotlib.pyplot as plt
 
+EQUITY_CACHE_FILENAME = './outputs/equity_cache.bin'
+METRICS_FILENAME = './outputs/metrics.csv' # watch a running training with python metrics.py --follow
+
+def training_players(shared_q_table, shared_q_deltas=None):
+    # 3 Handed Training
+    return [
+        HonestBot(name="Honest_Hannah", chips=1000),
+        QLearningBot(name="Bot_Ricky", chips=1000, shared_q_table=shared_q_table, shared_q_deltas=shared_q_deltas),
+        QLearningBot(name="Bot_Bob", chips=1000, shared_q_table=shared_q_table, shared_q_deltas=shared_q_deltas),
+    ]
+
 def main():
-    # Load Q Table
-    q_table_filename = "./outputs/q_table.json"
-    shared_q_table = {}
-    try:
-        with open(q_table_filename, 'r') as q_table_file:
-            q_table = json.load(q_table_file)
-            shared_q_table = {eval(k): v for k, v in q_table.items()}
-            print(f"Q-table loaded, length: {len(shared_q_table)}")
-    except:
+    parser = argparse.ArgumentParser(description="Train the Q-learning bots by self-play.")
+    parser.add_argument('--workers', type=int, default=1, help="tables played in parallel, one process each")
+    parser.add_argument('--rounds', type=int, default=3000000, help="rounds played per table")
+    parser.add_argument('--merge-interval', type=int, default=10000, help="rounds between Q-table merges across workers")
+    parser.add_argument('--shared-q-table', action='store_true', help="workers update one Q-table in shared memory instead of merging")
+    parser.add_argument('--array-q-table', action='store_true', help="keep the Q-table as NumPy rows of action values instead of a dict")
+    parser.add_argument('--q-table-slots', type=int, default=1 << 22, help="capacity of the shared Q-table, a power of two")
+    parser.add_argument('--seed', type=int, default=None, help="seed for reproducible runs, worker i uses seed + i")
+    parser.add_argument('--checkpoint-interval', type=int, default=10000, help="rounds between Q-table checkpoints, parallel runs checkpoint at every merge")
+    parser.add_argument('--resume', action='store_true', help="continue the interrupted run from its last checkpoint")
+    parser.add_argument('--log-level', choices=LEVELS, default='warning', help="game events streamed to outputs/game_log.txt")
+    parser.add_argument('--hand-history', default=None, help="record every hand to PREFIX.00000.hh, ..., numbered after any files already there (single table runs)")
+    parser.add_argument('--compress-history', action='store_true', help="gzip the hand history files")
+    parser.add_argument('--profile', action='store_true', help="time each phase of a round, written every 100 rounds to outputs/profile_log.json (single table runs)")
+    args = parser.parse_args()
+    if args.array_q_table and args.shared_q_table:
+        parser.error("--array-q-table and --shared-q-table are different tables, pick one")
+
+    # Load Q Table with any checkpoints logged after it, from the old JSON export if there is no binary one yet
+    q_table_filename = "./outputs/q_table.bin"
+    legacy_q_table_filename = "./outputs/q_table.json"
+    shared_q_table, sequence, checkpoint_round = resume_q_table(q_table_filename)
+    if sequence:
+        print(f"Q-table loaded from checkpoint {sequence} at round {checkpoint_round}, length: {len(shared_q_table)}")
+    elif os.path.exists(q_table_filename):
+        print(f"Q-table loaded, length: {len(shared_q_table)}")
+    elif os.path.exists(legacy_q_table_filename):
+        shared_q_table = TrackedQTable(load_json_q_table(legacy_q_table_filename))
+        print(f"Q-table loaded from {legacy_q_table_filename}, length: {len(shared_q_table)}")
+    else:
         print('No starting Q-table.')
+    if args.array_q_table:
+        shared_q_table = ArrayQTable(shared_q_table, capacity=max(1 << 12, 2 * len(shared_q_table)))
 
-    num_rounds = 3000000
+    num_rounds = args.rounds
+    start_round = checkpoint_round if args.resume else 0
+    if start_round >= num_rounds:
+        print(f"Run already finished at round {start_round}.")
+        return
 
-    # # 3 Handed Training
-    players = [
-        HonestBot(name="Honest_Hannah", chips=1000),
-        QLearningBot(name="Bot_Ricky", chips=1000, shared_q_table=shared_q_table),
-        QLearningBot(name="Bot_Bob", chips=1000, shared_q_table=shared_q_table),
-    ]
+    if args.workers > 1:
+        checkpointer = None
+        if args.shared_q_table:
+            q_table = SharedQTable(capacity=args.q_table_slots)
+            q_table.update(shared_q_table)
+            shared_q_table = q_table
+        else:
+            checkpointer = QTableCheckpointer(shared_q_table, q_table_filename, sequence=sequence)
+        score_log = train_parallel(training_players, shared_q_table, args.workers, num_rounds - start_round,
+                                   args.merge_interval, args.seed, EQUITY_CACHE_FILENAME, start_round, num_rounds,
+                                   checkpointer.checkpoint if checkpointer else None)
+        if checkpointer:
+            checkpointer.close(num_rounds)
+        else:
+            # a checkpoint after any the log holds, so --resume does not replay older frames over it
+            write_snapshot(shared_q_table, q_table_filename, sequence + 1, num_rounds)
+        print(f"Shared Q-table exported to {q_table_filename}")
+        if args.shared_q_table:
+            shared_q_table.close()
+        with open('./outputs/score_log.json', 'w') as f:
+            json.dump(score_log, f, indent=2)
+        visualize_scores('./outputs/score_log.json')
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        hand_rank_monte_carlo.seed(args.seed)
+
+    # Equity cache on disk, shared with any other process training from ./outputs
+    equity_cache.open_disk(EQUITY_CACHE_FILENAME)
+
+    players = training_players(shared_q_table)
     
     # 3 Handed Testing
     # players = [
@@ -59,14 +135,33 @@ def main():
     # ]
 
     game = PokerGame(players)
-    game.play_game(num_rounds=num_rounds)
+    game.log_level = LEVELS[args.log_level]
+    game.log.open_sink('./outputs/game_log.txt')
+    if args.hand_history:
+        game.hand_history = HandHistoryWriter(args.hand_history, [player.name for player in players],
+                                              compress=args.compress_history)
+    if args.profile:
+        game.profile = PhaseProfile()
+    game.metrics = MetricsWriter(METRICS_FILENAME, resume_round=start_round if args.resume else None)
+    checkpointer = QTableCheckpointer(shared_q_table, q_table_filename, sequence=sequence)
+    played = start_round
+    while played < num_rounds:
+        batch = min(args.checkpoint_interval, num_rounds - played)
+        game.play_game(batch, start_round=played, total_rounds=num_rounds)
+        played += batch
+        if played < num_rounds:
+            checkpointer.checkpoint(played)
     # Export Q Table
-    with open(q_table_filename, 'w') as q_table_file:
-        json.dump({str(k): v for k, v in shared_q_table.items()}, q_table_file, indent=2)
-    game.log_message(f"Shared Q-table exported to {q_table_filename}")
-    game.write_score_log_to_file()
-    visualize_scores('./outputs/score_log.json')
+    checkpointer.close(played)
+    game.log_message(INFO, "Shared Q-table exported to {}", q_table_filename)
+    game.metrics.close()
+    if args.profile:
+        game.write_profile_log_to_file()
+    plot_metrics(METRICS_FILENAME, './outputs/score_plot.png')
     game.write_log_to_file() 
+    if game.hand_history:
+        game.hand_history.close()
+    equity_cache.close()
 
 def visualize_scores(score_log_filename):
     # Load the score log from the JSON file
@@ -76,7 +171,7 @@ def visualize_scores(score_log_filename):
     plt.figure(figsize=(10, 6))
 
     for player, scores in score_log.items():
-        rounds = [i * 10000 for i in range(len(scores))]
+        rounds = [i * SCORE_INTERVAL for i in range(len(scores))]
         plt.plot(rounds, scores, marker='o', label=player) 
 
     plt.xlabel('Round')
@@ -0,0 +1,55 @@
+# Q-table states are packed ints instead of tuples of strings:
+#   bits 0-1 stage, 2-6 hand strength (0-20), 7-10 position from the button, 11+ action history
+# The action history of the current betting round is a 1 bit sentinel followed by 7 bits per
+# action taken, 4 for the position of the player who acted and 3 for the action code, so equal
+# histories always pack to the same int. Actions are keyed by their code from actions.py.
+from actions import ACTION_CODES, ACTION_NAMES
+
+STAGES = ['Pre-Flop', 'Flop', 'Turn', 'River']
+POSITIONS = ['btn', 'sb', 'bb', 'utg', 'mp', 'co']
+STAGE_CODES = {stage: code for code, stage in enumerate(STAGES)}
+EMPTY_HISTORY = 1
+
+def position_name(position):
+    return POSITIONS[position] if position < len(POSITIONS) else f'pos_{position}'
+
+def position_code(name):
+    return POSITIONS.index(name) if name in POSITIONS else int(name.split('_')[1])
+
+def append_action(history, position, action):
+    return history << 7 | position << 3 | action
+
+def encode_state(stage, position, hand_strength, history):
+    return history << 11 | position << 7 | hand_strength << 2 | STAGE_CODES[stage]
+
+def state_stage(state):
+    return STAGES[state & 3]
+
+def state_hand_strength(state):
+    return state >> 2 & 31
+
+def decode_history(history):
+    """The packed history as the flat [position, action, ...] list of names old states held."""
+    actions = []
+    while history > EMPTY_HISTORY:
+        actions[:0] = [position_name(history >> 3 & 15), ACTION_NAMES[history & 7]]
+        history >>= 7
+    return actions
+
+def decode_state(state):
+    """The readable (stage, position, hand_strength, past_actions) tuple a state packs."""
+    return (state_stage(state), position_name(state >> 7 & 15), state_hand_strength(state),
+            tuple(decode_history(state >> 11)))
+
+def encode_legacy_state(state):
+    stage, position, hand_strength, past_actions = state
+    history = EMPTY_HISTORY
+    for i in range(0, len(past_actions), 2):
+        history = append_action(history, position_code(past_actions[i]), ACTION_CODES[past_actions[i + 1]])
+    return encode_state(stage, position_code(position), hand_strength, history)
+
+def encode_q_table(q_table):
+    """Copy of a Q-table with any old tuple states and action names packed."""
+    return {(encode_legacy_state(state) if isinstance(state, tuple) else state,
+             ACTION_CODES[action] if isinstance(action, str) else action): value
+            for (state, action), value in q_table.items()}
@@ -0,0 +1,26 @@
+import multiprocessing
+from q_table import SharedQTable
+from rl_bot import QLearningBot
+
+STATE_ACTION = (12345, 2)
+WORKERS = 4
+UPDATES = 20000
+
+def learn(q_table):
+    bot = QLearningBot("Bot", 1000, initial_learning_rate=1, shared_q_table=q_table)
+    for _ in range(UPDATES):
+        bot.states_actions = [STATE_ACTION]
+        bot.receive_reward(1)
+
+def test_concurrent_learners_keep_every_update():
+    q_table = SharedQTable(capacity=1 << 10)
+    try:
+        workers = [multiprocessing.Process(target=learn, args=(q_table,)) for _ in range(WORKERS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert all(worker.exitcode == 0 for worker in workers)
+        assert q_table.get(STATE_ACTION) == WORKERS * UPDATES
+    finally:
+        q_table.close()
@@ -1,35 +1,51 @@
 import time
 import random
-from hand_rank_monte_carlo import monte_carlo_simulation
+import numpy as np
+from hand_rank_monte_carlo import monte_carlo_simulation, batch_equity, canonical_key
+from equity_cache import EquityCache
+from preflop_equity import MAX_OPPONENTS, hand_class, load_table, strength_table
 
-class Card:
+class Card(int):
+    """A card is its index rank * 4 + suit, the encoding the Cython evaluator works on.
+    Suit and rank strings are only rebuilt for logging."""
+    __slots__ = ()
     SUITS = ['h', 'd', 'c', 's']
     RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
-    def __init__(self, suit, rank):
-        self.suit = suit
-        self.rank = rank
+    def __new__(cls, suit, rank):
+        return super().__new__(cls, Card.RANKS.index(rank) * 4 + Card.SUITS.index(suit))
+    @property
+    def suit(self):
+        return Card.SUITS[self & 3]
+    @property
+    def rank(self):
+        return Card.RANKS[self >> 2]
     def __repr__(self):
         return f"{self.rank}{self.suit}"
-    def __eq__(self, other):
-        return self.rank == other.rank and self.suit == other.suit
 
-def card_to_tuple(card):
-    """Convert a Card object to a tuple of (suit, rank) for Cython processing"""
-    return (card.suit, card.rank)
+# all 52 cards, CARDS[i] == i
+CARDS = [Card(suit, rank) for rank in Card.RANKS for suit in Card.SUITS]
 
 def rank_to_value(rank):
     return '@@23456789TJQKA'.index(rank)
 
 class Deck:
+    """The 52 cards in one reused list. Each deal swaps a uniformly drawn card from the
+    undealt front of the list to its end, a Fisher-Yates shuffle stopped after the cards a
+    hand needs, so a reset only has to mark every card undealt again."""
     def __init__(self):
-        self.cards = [Card(suit, rank) for suit in Card.SUITS for rank in Card.RANKS]
-        self.shuffle()
+        self.cards = list(CARDS)
+        self.remaining = len(self.cards)
     def deal(self):
-        return self.cards.pop()
+        cards = self.cards
+        last = self.remaining - 1
+        index = int(random.random() * self.remaining)
+        cards[index], cards[last] = cards[last], cards[index]
+        self.remaining = last
+        return cards[last]
     def shuffle(self):
-        random.shuffle(self.cards)
+        self.remaining = len(self.cards)
     def reset(self):
-        self.__init__()
+        self.remaining = len(self.cards)
 
 def describe_hand(hand_rank):
     rank_type, rank_values = hand_rank
@@ -55,64 +71,52 @@ def describe_hand(hand_rank):
     else:  # High Card
         return f"High Card, {card_value_to_name(rank_values[0])}"
 
-# pre flop starting hand map
-starting_hands = {
-    # Pairs
-    'AA': 100, 'KK': 100, 'QQ': 95, 'JJ': 90, 'TT': 85,
-    '99': 80, '88': 75, '77': 70, '66': 65, '55': 60,
-    '44': 60, '33': 60, '22': 60,
+# pre flop hand strength by number of opponents - 1 and hand class, from the equity table
+preflop_strengths = strength_table(load_table())
 
-    # Suited Hands
-    'AKs': 95, 'AQs': 90, 'AJs': 85, 'ATs': 80, 'A9s': 70,
-    'A8s': 70, 'A7s': 60, 'A6s': 60, 'A5s': 70, 'A4s': 60,
-    'A3s': 50, 'A2s': 50, 'KQs': 85, 'KJs': 80, 'KTs': 75,
-    'K9s': 70, 'K8s': 65, 'K7s': 60, 'K6s': 55, 'K5s': 50,
-    'K4s': 45, 'K3s': 40, 'K2s': 35, 'QJs': 75, 'QTs': 70,
-    'Q9s': 65, 'Q8s': 60, 'Q7s': 55, 'Q6s': 50, 'Q5s': 45,
-    'Q4s': 40, 'Q3s': 35, 'Q2s': 30, 'JTs': 65, 'J9s': 60,
-    'J8s': 55, 'J7s': 50, 'J6s': 45, 'J5s': 40, 'J4s': 35,
-    'J3s': 30, 'J2s': 25, 'T9s': 55, 'T8s': 50, 'T7s': 45,
-    'T6s': 40, 'T5s': 35, 'T4s': 30, 'T3s': 25, 'T2s': 20,
-    '98s': 50, '97s': 45, '96s': 40, '95s': 35, '94s': 30,
-    '93s': 25, '92s': 20, '87s': 45, '86s': 40, '85s': 35,
-    '84s': 30, '83s': 25, '82s': 20, '76s': 30, '75s': 25,
-    '74s': 20, '73s': 15, '72s': 10, '65s': 25, '64s': 20,
-    '63s': 15, '62s': 10, '54s': 20, '53s': 15, '52s': 10,
-    '43s': 15, '42s': 10, '32s': 5,
-
-    # Off-suit Hands
-    'AK': 90, 'AQ': 85, 'AJ': 80, 'AT': 75, 'A9': 65,
-    'A8': 65, 'A7': 55, 'A6': 55, 'A5': 65, 'A4': 55,
-    'A3': 45, 'A2': 45, 'KQ': 80, 'KJ': 75, 'KT': 70,
-    'K9': 65, 'K8': 60, 'K7': 55, 'K6': 50, 'K5': 45,
-    'K4': 40, 'K3': 35, 'K2': 30, 'QJ': 70, 'QT': 65,
-    'Q9': 60, 'Q8': 55, 'Q7': 50, 'Q6': 45, 'Q5': 40,
-    'Q4': 35, 'Q3': 30, 'Q2': 25, 'JT': 60, 'J9': 55,
-    'J8': 50, 'J7': 45, 'J6': 40, 'J5': 35, 'J4': 30,
-    'J3': 25, 'J2': 20, 'T9': 50, 'T8': 45, 'T7': 40,
-    'T6': 35, 'T5': 30, 'T4': 25, 'T3': 20, 'T2': 15,
-    '98': 45, '97': 40, '96': 35, '95': 30, '94': 25,
-    '93': 20, '92': 15, '87': 40, '86': 35, '85': 30,
-    '84': 25, '83': 20, '82': 15, '76': 25, '75': 20,
-    '74': 15, '73': 10, '72': 5, '65': 20, '64': 15,
-    '63': 10, '62': 5, '54': 15, '53': 10, '52': 5,
-    '43': 10, '42': 5, '32': 0
-}
+# post flop equities, shared by every bot in the process
+equity_cache = EquityCache()
 
 def evaluate_hand_strength(game,player,num_sim):
     # evaluate situation and give a score between 0 and 20
+    num_opponents = max(1, sum(1 for p in game.players if not p.folded and p is not player))
     if not game.community_cards:
         card1, card2 = player.hand
-        ranks = sorted([card1.rank, card2.rank], reverse=True, key=rank_to_value)
-        suits = [card1.suit, card2.suit]
-        if suits[0] == suits[1]:
-            hand_key = f"{ranks[0]}{ranks[1]}s"
-        else:
-            hand_key = f"{ranks[0]}{ranks[1]}"
-        return int(starting_hands[hand_key]/5)
+        return preflop_strengths[min(num_opponents, MAX_OPPONENTS) - 1][hand_class(card1, card2)]
     else:
-        # simulate game out to estimate the win rate / value
-        return int(monte_carlo_simulation([card_to_tuple(card) for card in player.hand], [card_to_tuple(card) for card in game.community_cards],num_sim)*20)
+        # simulate game out against everyone still in the hand, once per isomorphic spot
+        key = canonical_key(player.hand, game.community_cards, num_opponents)
+        equity = equity_cache.get(key)
+        if equity is None:
+            start_time = time.perf_counter()
+            win, tie, loss = monte_carlo_simulation(player.hand, game.community_cards, num_sim, num_opponents)
+            equity = win + tie / 2
+            equity_cache.put(key, equity, time.perf_counter() - start_time)
+        return int(equity*20)
+
+def prefetch_hand_strengths(game, num_sim):
+    """Put the equity of every player still in the hand who evaluates hand strength into
+    the cache with one batch_equity call, right after a street is dealt."""
+    if not game.community_cards:
+        return
+    num_opponents = max(1, sum(1 for p in game.players if not p.folded) - 1)
+    keys, hands = [], []
+    for player in game.players:
+        if player.folded or player.chips == 0 or not player.evaluates_hand_strength:
+            continue
+        key = canonical_key(player.hand, game.community_cards, num_opponents)
+        if key not in keys and equity_cache.get(key, count=False) is None:
+            keys.append(key)
+            hands.append(player.hand)
+    if not keys:
+        return
+    boards = np.full((len(keys), 5), -1)
+    boards[:, :len(game.community_cards)] = game.community_cards
+    start_time = time.perf_counter()
+    equities = batch_equity(hands, boards, num_sim, num_opponents)
+    eval_time = (time.perf_counter() - start_time) / len(keys)
+    for key, equity in zip(keys, equities):
+        equity_cache.put(key, float(equity), eval_time)
 
 # Test
 def test_monte_carlo():
@@ -120,8 +124,9 @@ def test_monte_carlo():
     community_cards = [Card('s', '9'), Card('s', '2'), Card('d', '8')]
     print(f"Hand: {hand}, Community Cards: {community_cards}")
     start_time = time.time()
-    strength = monte_carlo_simulation([card_to_tuple(card) for card in hand], [card_to_tuple(card) for card in community_cards], num_simulations = 100)
-    print(f"Estimated Strength: {strength:.2f} (win rate)")
+    for num_opponents in [1, 2, 5]:
+        win, tie, loss = monte_carlo_simulation(hand, community_cards, num_simulations = 100, num_opponents = num_opponents)
+        print(f"{num_opponents} opponent(s): win {win:.2f}, tie {tie:.2f}, loss {loss:.2f}")
     elapsed_time = time.time() - start_time
     print(f"Time Taken: {elapsed_time:.2f} seconds")
 